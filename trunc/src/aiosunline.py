@@ -0,0 +1,409 @@
+import asyncio
+import itertools
+import struct
+import time
+from modbus_tk.modbus import ModbusInvalidResponseError
+from sunline import SunlineDeviceBase, AutoTransformer, COMMIT_DELAY
+from modbus_io import PRIORITY_WRITE, PRIORITY_POLL
+from pdu import build_pdu, response_length, parse_pdu
+from rtu import request_frame, parse_frame
+from timing import Deadline, TICK_COALESCE
+from timeouts import ResponseTimeouts, MIN_RESPONSE_TIMEOUT, MAX_RESPONSE_TIMEOUT
+from transport import parse_url, SERIAL_SCHEMES, TCP_SCHEMES, RTU_OVER_TCP_SCHEMES
+
+try:
+    import serial_asyncio
+except ImportError:
+    serial_asyncio = None
+
+try:
+    import qasync
+except ImportError:
+    qasync = None
+
+
+# Асинхронная линия RS-485. Все линии работают в одном цикле событий,
+# обмен с портом сериализуется очередью с теми же приоритетами, что и у ModbusWorker.
+class AsyncSunlineBus:
+    def __init__(self, port, baudrate, update_interval=0.1, commit_interval=1, timeout=MAX_RESPONSE_TIMEOUT, adaptive=False,
+                 missed_ticks=TICK_COALESCE, min_timeout=MIN_RESPONSE_TIMEOUT, commit_delay=COMMIT_DELAY):
+        self.port = port
+        self.timeouts = ResponseTimeouts(int(baudrate) if baudrate else 19200, min_timeout, timeout)
+        self.mbap = parse_url(port)[0] in TCP_SCHEMES
+        self.update_interval = update_interval
+        self.commit_interval = commit_interval
+        self.timeout = timeout
+        self.adaptive = adaptive
+        # Периоды опроса не растягиваются: бюджет времени линии ведёт только SunlineBus
+        self.stretch = 1.0
+        self.update_schedule = Deadline(update_interval, missed_ticks)
+        self.commit_schedule = Deadline(commit_interval, missed_ticks)
+        # Окно сбора правок перед записью, с; None - запись по таймеру раз в commit_interval
+        self.commit_delay = commit_delay
+        self._loop = None
+        self._commit_pending = set()
+        self._commit_task = None
+        # Отложенные повторы записи без ответа: устройство -> asyncio.TimerHandle
+        self._commit_retries = {}
+        # Устройства, запись которых ещё идёт, и те, что нужно записать снова после неё
+        self._committing = set()
+        self._commit_again = set()
+        self.devices = []
+        self.reader = None
+        self.writer = None
+        self.queue = None
+        self._counter = itertools.count()
+        self._tasks = []
+        self._resync = False
+        self._transaction_id = itertools.count(1)
+        self.reconnect_delay = 0.1
+        self.max_reconnect_delay = 10
+        self._backoff = self.reconnect_delay
+        self._retry_at = 0
+
+    async def open_connection(self):
+        scheme, target, port = parse_url(self.port)
+        if scheme in SERIAL_SCHEMES:
+            if serial_asyncio is None:
+                raise Exception('pyserial-asyncio is required for the asyncio engine')
+            return await serial_asyncio.open_serial_connection(url=target, baudrate=self.baudrate,
+                                                               bytesize=8, parity='N', stopbits=1, xonxoff=0)
+        if scheme in TCP_SCHEMES + RTU_OVER_TCP_SCHEMES:
+            return await asyncio.open_connection(target, port)
+        raise ValueError('Unknown transport %s' % scheme)
+
+    async def reconnect(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if asyncio.get_event_loop().time() < self._retry_at:
+            raise ConnectionError('Connection is not established')
+        try:
+            self.reader, self.writer = await self.open_connection()
+        except OSError:
+            self._retry_at = asyncio.get_event_loop().time() + self._backoff
+            self._backoff = min(self._backoff * 2, self.max_reconnect_delay)
+            raise
+        self._backoff = self.reconnect_delay
+        self._resync = False
+
+    async def open(self):
+        try:
+            self.reader, self.writer = await self.open_connection()
+        except OSError:
+            # Недоступный шлюз не мешает запуску: io_loop переподключится сам
+            if parse_url(self.port)[0] in SERIAL_SCHEMES:
+                raise
+        self.queue = asyncio.PriorityQueue()
+        self._tasks.append(asyncio.ensure_future(self.io_loop()))
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for handle in self._commit_retries.values():
+            handle.cancel()
+        self._commit_retries = {}
+        self._committing = set()
+        self._commit_again = set()
+        self._loop = None
+        self._commit_task = None
+        while self.queue is not None and not self.queue.empty():
+            _, _, (_, future) = self.queue.get_nowait()
+            future.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    @property
+    def baudrate(self):
+        return self.timeouts.baudrate
+
+    @baudrate.setter
+    def baudrate(self, value):
+        self.timeouts.baudrate = value
+
+    def add_device(self, device):
+        device.bus = self
+        if device not in self.devices:
+            self.devices.append(device)
+        device.build_read_plan()
+
+    def remove_device(self, device):
+        if device in self.devices:
+            self.devices.remove(device)
+
+    def submit(self, priority, slave, funcode, address, quantity_of_x=0, output_value=0):
+        future = asyncio.get_event_loop().create_future()
+        self.queue.put_nowait((priority, next(self._counter),
+                               ((slave, funcode, address, quantity_of_x, output_value), future)))
+        return future
+
+    async def execute(self, slave, funcode, address, quantity_of_x=0, output_value=0, priority=PRIORITY_POLL):
+        return await self.submit(priority, slave, funcode, address, quantity_of_x, output_value)
+
+    async def io_loop(self):
+        while True:
+            _, _, (args, future) = await self.queue.get()
+            if future.cancelled():
+                continue
+            try:
+                if self.writer is None:
+                    await self.reconnect()
+                timeout = self.timeouts.timeout(*args)
+                started = time.monotonic()
+                if self.mbap:
+                    result = await self.transact_tcp(*args, timeout=timeout)
+                else:
+                    result = await self.transact(*args, timeout=timeout)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except (OSError, asyncio.IncompleteReadError) as e:
+                # Разрыв соединения со шлюзом: переподключимся перед следующей транзакцией
+                if self.writer is not None:
+                    self.writer.close()
+                    self.writer = None
+                future.set_exception(e)
+            except ModbusInvalidResponseError as e:
+                self.timeouts.expired(*args)
+                future.set_exception(e)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                self.timeouts.observe(time.monotonic() - started, *args)
+                future.set_result(result)
+
+    async def transact(self, slave, funcode, address, quantity_of_x=0, output_value=0, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        request = request_frame(slave, funcode, address, quantity_of_x, output_value)
+        if self._resync:
+            await self.discard_input()
+        self.writer.write(request)
+        await self.writer.drain()
+        try:
+            header = await asyncio.wait_for(self.reader.readexactly(2), timeout)
+            # Ответ-исключение всегда 5 байт, нормальный ответ - по коду функции и количеству
+            if header[1] & 0x80:
+                length = 5
+            else:
+                length = response_length(funcode, quantity_of_x)
+            tail = await asyncio.wait_for(self.reader.readexactly(length - 2), timeout)
+        except asyncio.TimeoutError:
+            self._resync = True
+            raise ModbusInvalidResponseError('Response timeout')
+        try:
+            return parse_frame(header + tail, slave, funcode, quantity_of_x)
+        except ModbusInvalidResponseError:
+            self._resync = True
+            raise
+
+    async def transact_tcp(self, slave, funcode, address, quantity_of_x=0, output_value=0, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        pdu = build_pdu(funcode, address, quantity_of_x, output_value)
+        transaction_id = next(self._transaction_id) & 0xffff
+        self.writer.write(struct.pack('>HHHB', transaction_id, 0, len(pdu) + 1, slave) + pdu)
+        await self.writer.drain()
+        while True:
+            try:
+                header = await asyncio.wait_for(self.reader.readexactly(7), timeout)
+                length = struct.unpack_from('>H', header, 4)[0]
+                response = await asyncio.wait_for(self.reader.readexactly(length - 1), timeout)
+            except asyncio.TimeoutError:
+                raise ModbusInvalidResponseError('Response timeout')
+            # Ответ на предыдущий запрос, по которому истёк таймаут, пропускаем
+            if struct.unpack_from('>H', header)[0] == transaction_id:
+                return parse_pdu(funcode, quantity_of_x, response)
+
+    # Остатки опоздавшего или битого ответа не должны попасть в следующий
+    async def discard_input(self):
+        self._resync = False
+        while True:
+            try:
+                data = await asyncio.wait_for(self.reader.read(256), 0.01)
+            except asyncio.TimeoutError:
+                return
+            if not data:
+                # Конец потока: шлюз или адаптер закрыл соединение, нужно переподключиться
+                self.writer.close()
+                self.writer = None
+                raise ConnectionResetError('Connection closed by peer')
+
+    async def update_devices(self):
+        for device in list(self.devices):
+            await device.update_registers()
+
+    async def commit_devices(self):
+        for device in list(self.devices):
+            await device.commit()
+
+    # Может вызываться из любого потока: запись планируется в цикле событий линии
+    def schedule_commit(self, device):
+        if self.commit_delay is None or self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._commit_soon, device)
+
+    def _commit_soon(self, device):
+        handle = self._commit_retries.pop(device, None)
+        if handle is not None:
+            handle.cancel()
+        self._commit_pending.add(device)
+        if self._commit_task is None:
+            self._commit_task = asyncio.ensure_future(self.flush_commits())
+            self._tasks.append(self._commit_task)
+
+    async def flush_commits(self):
+        await asyncio.sleep(self.commit_delay)
+        self._tasks.remove(self._commit_task)
+        self._commit_task = None
+        devices, self._commit_pending = self._commit_pending, set()
+        for device in devices:
+            if device in self._committing:
+                # Вторая запись того же устройства повторила бы кадры первой: правки уйдут,
+                # когда первая закончится
+                self._commit_again.add(device)
+                continue
+            self._committing.add(device)
+            try:
+                await device.commit()
+            finally:
+                self._committing.discard(device)
+            if device in self._commit_again:
+                self._commit_again.discard(device)
+                self._commit_soon(device)
+            # Правка во время записи уже запланирована через register_modified, а запись
+            # без ответа повторяется после паузы
+            elif device.modified and not device.health.offline and not device.edited_in_flight:
+                self._commit_retries[device] = self._loop.call_later(device.commit_backoff, self._commit_soon,
+                                                                     device)
+
+    async def periodic(self, proc, schedule):
+        schedule.start(time.monotonic())
+        while True:
+            await asyncio.sleep(schedule.delay(time.monotonic()))
+            started = schedule.begin(time.monotonic())
+            await proc()
+            schedule.end(started, time.monotonic())
+
+    def cycle_statistics(self):
+        return {'update': self.update_schedule.statistics(),
+                'commit': self.commit_schedule.statistics()}
+
+    def start(self):
+        self._loop = asyncio.get_event_loop()
+        self._tasks.append(asyncio.ensure_future(self.periodic(self.update_devices, self.update_schedule)))
+        if self.commit_delay is None:
+            self._tasks.append(asyncio.ensure_future(self.periodic(self.commit_devices, self.commit_schedule)))
+            return
+        for device in self.devices:
+            if device.modified:
+                self.schedule_commit(device)
+
+    async def stop(self):
+        await self.close()
+
+
+class AsyncSunlineDevice(SunlineDeviceBase):
+    def __init__(self, bus, slave=1):
+        self.init_registers(slave)
+        # Запросы чтения read(), которые сейчас выполняются: запрос плана -> задача
+        self._flights = {}
+
+        self.bus = bus
+        bus.add_device(self)
+
+    async def read_planned(self, plan, priority):
+        for request in plan:
+            data = await self.bus.execute(self.slave, request.funcode, request.address, request.count,
+                                          priority=priority)
+            self.read_done(request, data)
+
+    # Как SunlineDevice.read: значения регистров не старше max_age секунд (None - подходит
+    # любое полученное), свежие берутся из кэша. Читаются только запросы плана, которые
+    # покрывают устаревшие регистры; запрос, который уже выполняется для другого вызова,
+    # не повторяется, а ожидается.
+    async def read(self, names, max_age: float = 0, priority=PRIORITY_POLL):
+        now = time.monotonic()
+        regs = self.registers(names)
+        stale = set(reg for reg in regs if not reg.is_fresh(now, max_age))
+        flights = []
+        for _, plan, _ in self.read_tables():
+            for request in plan:
+                if stale.isdisjoint(request.registers):
+                    continue
+                flight = self._flights.get(request)
+                if flight is None:
+                    flight = self._flights[request] = asyncio.ensure_future(self.read_request(request, priority))
+                flights.append(flight)
+        # Отмена одного вызова не должна отменять чтение, которого ждут другие
+        results = await asyncio.gather(*[asyncio.shield(flight) for flight in flights], return_exceptions=True)
+        for error in results:
+            if isinstance(error, Exception):
+                self.communicate.ErrorReadingRegister.emit(str(error))
+        return self.fresh_values(regs, now, max_age)
+
+    async def read_request(self, request, priority):
+        try:
+            await self.read_planned([request], priority)
+        finally:
+            del self._flights[request]
+
+    async def update_registers(self):
+        plans = self.due_reads()
+        # Отключённое устройство до срока проверки связи не опрашивается
+        if self.health.offline and not plans:
+            return
+        outcomes = []
+        for name, plan in plans:
+            try:
+                for request in plan:
+                    await self.read_planned([request], self.read_priority(name, request))
+                    outcomes.append((name, None))
+            except Exception as e:
+                outcomes.append((name, e))
+        self.reads_finished(outcomes)
+
+        self.communicate.RegistersUpdated.emit()
+
+    # Все кадры записи ставятся в очередь линии разом и уходят подряд
+    async def commit(self):
+        if self.health.offline:
+            self.offline_writes()
+            return None
+        results, generations = self.commit_started()
+        batch = self.plan_commit()
+        submitted = [(name, request, self.bus.submit(PRIORITY_WRITE, self.slave, request.funcode, request.address,
+                                                     output_value=request.output_value))
+                     for name, request in batch]
+        for name, request, future in submitted:
+            data = error = None
+            try:
+                data = await future
+            except Exception as e:
+                error = e
+            self.apply_write(request, None, data, error, results[name])
+        self.commit_finished(results, generations)
+        if batch:
+            self.communicate.RegistersCommited.emit()
+        return results
+
+
+class AsyncAutoTransformer(AsyncSunlineDevice):
+    slave_register = AutoTransformer.slave_register
+    discrete_input_list = AutoTransformer.discrete_input_list
+    coil_list = AutoTransformer.coil_list
+    input_register_list = AutoTransformer.input_register_list
+    holding_register_list = AutoTransformer.holding_register_list
+
+
+# Запускает цикл событий asyncio поверх цикла Qt (нужен пакет qasync),
+# чтобы окно работало с асинхронными устройствами без дополнительных потоков.
+def install_qt_event_loop(app):
+    if qasync is None:
+        raise Exception('qasync is required to run the asyncio engine inside Qt')
+    loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(loop)
+    return loop
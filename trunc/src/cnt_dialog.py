@@ -4,6 +4,8 @@ from sunline import AutoTransformer
 import modbus_tk.defines as cst
 from modbus_tk import exceptions
 from serial.tools import list_ports
+from discovery import Discovery
+from fleet import start_engine
 
 
 def serial_ports():
@@ -28,7 +30,7 @@ class Ui_Dialog(QtWidgets.QDialog):
         self.device = device
         self.setObjectName("Dialog")
         self.setWindowModality(QtCore.Qt.ApplicationModal)
-        self.resize(258, 97)
+        self.resize(300, 260)
         self.formLayout = QtWidgets.QFormLayout(self)
         self.formLayout.setObjectName("formLayout")
         self.lb_baud = QtWidgets.QLabel(self)
@@ -48,34 +50,116 @@ class Ui_Dialog(QtWidgets.QDialog):
         self.port.setObjectName("port")
         self.port.addItems(serial_ports())
         self.formLayout.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.port)
+        self.lb_slave = QtWidgets.QLabel(self)
+        self.lb_slave.setObjectName("lb_slave")
+        self.lb_slave.setText("Адрес устройства:")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.lb_slave)
+        self.slave = QtWidgets.QSpinBox(self)
+        self.slave.setObjectName("slave")
+        self.slave.setRange(1, 247)
+        self.slave.setValue(device.slave if device is not None else 1)
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.slave)
+        self.btn_discover = QtWidgets.QPushButton(self)
+        self.btn_discover.setObjectName("btn_discover")
+        self.btn_discover.setText("Поиск устройств")
+        self.btn_discover.clicked.connect(self.discover)
+        self.formLayout.setWidget(3, QtWidgets.QFormLayout.SpanningRole, self.btn_discover)
+        self.found = QtWidgets.QListWidget(self)
+        self.found.setObjectName("found")
+        self.found.itemClicked.connect(self.select_found)
+        self.found.itemDoubleClicked.connect(lambda item: self.accept_())
+        self.formLayout.setWidget(4, QtWidgets.QFormLayout.SpanningRole, self.found)
+        self.separate_process = QtWidgets.QCheckBox(self)
+        self.separate_process.setObjectName("separate_process")
+        self.separate_process.setText("Опрос в отдельном процессе")
+        # Режим выбирается только при первом соединении
+        self.separate_process.setEnabled(device is None)
+        self.formLayout.setWidget(5, QtWidgets.QFormLayout.SpanningRole, self.separate_process)
         self.buttonBox = QtWidgets.QDialogButtonBox(self)
         self.buttonBox.setStandardButtons(QtWidgets.QDialogButtonBox.Cancel|QtWidgets.QDialogButtonBox.Ok)
         self.buttonBox.rejected.connect(self.reject_)
         self.buttonBox.accepted.connect(self.accept_)
         self.buttonBox.setObjectName("buttonBox")
-        self.formLayout.setWidget(2, QtWidgets.QFormLayout.SpanningRole, self.buttonBox)
+        self.formLayout.setWidget(6, QtWidgets.QFormLayout.SpanningRole, self.buttonBox)
         self.setWindowTitle("Соединение с устройством")
 
+        self.discovery = None
+
         QtCore.QMetaObject.connectSlotsByName(self)
 
+    # Поиск идёт в фоне, найденные устройства появляются в списке по мере обнаружения
+    def discover(self):
+        self.stop_discovery()
+        self.found.clear()
+        ports = [self.port.itemText(i) for i in range(self.port.count())]
+        if self.device is not None:
+            # Порт, открытый текущим соединением, опрашивать нельзя
+            ports = [port for port in ports if port != self.device.bus.port]
+        self.discovery = Discovery(ports)
+        self.discovery.communicate.DeviceFound.connect(self.device_found)
+        self.discovery.communicate.Finished.connect(self.discovery_finished)
+        self.btn_discover.setEnabled(False)
+        self.btn_discover.setText("Идёт поиск...")
+        self.discovery.start()
+
+    def stop_discovery(self):
+        if self.discovery is not None:
+            self.discovery.stop()
+
+    def device_found(self, port, baudrate, slave):
+        item = QtWidgets.QListWidgetItem('%s, %d бод, адрес %d' % (port, baudrate, slave))
+        item.setData(QtCore.Qt.UserRole, (port, baudrate, slave))
+        self.found.addItem(item)
+        if self.found.count() == 1:
+            self.found.setCurrentItem(item)
+            self.select_found(item)
+
+    def discovery_finished(self):
+        self.btn_discover.setEnabled(True)
+        self.btn_discover.setText("Поиск устройств")
+        if self.found.count() == 0:
+            self.found.addItem('Устройства не найдены')
+
+    def select_found(self, item):
+        found = item.data(QtCore.Qt.UserRole)
+        if found is None:
+            return
+        port, baudrate, slave = found
+        self.port.setCurrentIndex(self.port.findText(port, QtCore.Qt.MatchFixedString))
+        index = self.baud.findText(str(baudrate), QtCore.Qt.MatchFixedString)
+        if index < 0:
+            self.baud.addItem(str(baudrate))
+            index = self.baud.count() - 1
+        self.baud.setCurrentIndex(index)
+        self.slave.setValue(slave)
+
     def reject_(self):
+        self.stop_discovery()
         self.accept = False
         self.close()
 
     def accept_(self):
+        self.stop_discovery()
         self.accept = True
         baud_ = self.baud.currentText()
         port_ = self.port.currentText()
+        slave_ = self.slave.value()
         try:
-            if self.device is None:
-                self.device = AutoTransformer(port_, baud_, autoupdate=True, autocommit=True)
-                self.device.rtu_master.execute(1, cst.READ_DISCRETE_INPUTS, 0, 1)
+            if self.device is None and self.separate_process.isChecked():
+                device = start_engine(port_, int(baud_), AutoTransformer, slave_)
+                try:
+                    device.execute(device.slave, cst.READ_DISCRETE_INPUTS, 0, 1)
+                except Exception:
+                    device.stop()
+                    raise
+                self.device = device
+            elif self.device is None:
+                self.device = AutoTransformer(port_, baud_, autoupdate=True, autocommit=True, slave=slave_)
+                self.device.execute(self.device.slave, cst.READ_DISCRETE_INPUTS, 0, 1)
             else:
-                self.device.rtu_master._serial.port = port_
-                self.device.rtu_master._serial.baudrate = baud_
-                self.device.rtu_master._serial.close()
-                self.device.rtu_master._serial.open()
-                self.device.rtu_master.execute(1, cst.READ_DISCRETE_INPUTS, 0, 1)
+                self.device.slave = slave_
+                self.device.bus.reconfigure(port_, int(baud_))
+                self.device.execute(self.device.slave, cst.READ_DISCRETE_INPUTS, 0, 1)
         except exceptions.ModbusInvalidResponseError:
             QMessageBox.critical(self, 'Ошибка', 'Не удалось установить соединение.', QMessageBox.Ok, QMessageBox.Ok)
             self.accept = False
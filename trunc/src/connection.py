@@ -0,0 +1,70 @@
+import threading
+from serial.tools import list_ports
+
+# Период опроса списка портов, с
+PORT_POLL_INTERVAL = 0.25
+
+
+# Признак, по которому USB-адаптер узнаётся после переподключения под другим именем
+# (ttyUSB0 -> ttyUSB1, COM3 -> COM4). У портов без USB признака нет.
+def port_identity(info):
+    if info.vid is None:
+        return None
+    return info.vid, info.pid, info.serial_number or info.location
+
+
+def present_ports():
+    return {info.device: port_identity(info) for info in list_ports.comports()}
+
+
+# Следит за появлением и исчезновением последовательных портов и сообщает о них линиям.
+# Один поток на процесс; линии подключаются в start() и отключаются в stop().
+class PortWatcher(threading.Thread):
+    def __init__(self, interval: float = PORT_POLL_INTERVAL):
+        threading.Thread.__init__(self, daemon=True)
+        self.interval = interval
+        self.buses = []
+        self._lock = threading.Lock()
+        self._stopevent = threading.Event()
+
+    # Поток запускается под тем же замком: две линии, подключённые одновременно,
+    # не должны запустить его дважды
+    def attach(self, bus):
+        with self._lock:
+            if bus not in self.buses:
+                self.buses.append(bus)
+            if not self.is_alive():
+                self.start()
+
+    def detach(self, bus):
+        with self._lock:
+            if bus in self.buses:
+                self.buses.remove(bus)
+
+    def run(self):
+        while not self._stopevent.wait(self.interval):
+            with self._lock:
+                buses = list(self.buses)
+            if not buses:
+                continue
+            try:
+                ports = present_ports()
+            except OSError:
+                continue
+            for bus in buses:
+                bus.check_port(ports)
+
+    def stop(self):
+        self._stopevent.set()
+
+
+_watcher = None
+_watcher_lock = threading.Lock()
+
+
+def port_watcher():
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = PortWatcher()
+        return _watcher
@@ -0,0 +1,100 @@
+import threading
+import modbus_tk.defines as cst
+from modbus_tk.modbus import ModbusError
+from PyQt5.QtCore import QObject, pyqtSignal
+from transport import open_master
+from timeouts import ResponseTimeouts
+
+# Скорости в порядке убывания вероятности: сначала заводская 19200
+DISCOVERY_BAUDRATES = (19200, 9600, 38400, 57600, 28800, 4800, 2400, 1200, 300)
+DISCOVERY_SLAVES = range(1, 33)
+# Время реакции устройства при поиске, с: таймаут ответа = время передачи кадров + это время
+DISCOVERY_TURNAROUND = 0.03
+
+
+class DiscoverySignals(QObject):
+    # Порт, скорость, адрес найденного устройства
+    DeviceFound = pyqtSignal(str, int, int)
+    # Порт и число найденных на нём устройств
+    PortScanned = pyqtSignal(str, int)
+    Finished = pyqtSignal()
+
+
+# Поиск устройств: все порты опрашиваются одновременно, каждый в своём потоке.
+# На порту перебираются скорости, на каждой скорости - адреса из slaves с коротким
+# таймаутом. Все устройства одной линии работают на одной скорости, поэтому после
+# первой скорости, на которой кто-то ответил, остальные скорости порта не проверяются.
+class Discovery:
+    def __init__(self, ports, baudrates=DISCOVERY_BAUDRATES, slaves=DISCOVERY_SLAVES,
+                 turnaround: float = DISCOVERY_TURNAROUND):
+        self.ports = list(ports)
+        self.baudrates = baudrates
+        self.slaves = slaves
+        self.turnaround = turnaround
+        self.communicate = DiscoverySignals()
+        self.results = []
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+
+    def start(self):
+        self._stopped.clear()
+        self._running = len(self.ports)
+        self._threads = [threading.Thread(target=self.scan_port, args=(port,), daemon=True) for port in self.ports]
+        for thread in self._threads:
+            thread.start()
+        if not self._threads:
+            self.communicate.Finished.emit()
+
+    def stop(self):
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join()
+
+    @property
+    def running(self):
+        return self._running > 0
+
+    def scan_port(self, port: str):
+        found = 0
+        try:
+            master = open_master(port, self.baudrates[0])
+            master.open()
+        except Exception:
+            master = None
+        try:
+            for baudrate in self.baudrates if master is not None else ():
+                found = self.scan_baudrate(master, port, baudrate)
+                if found or self._stopped.is_set():
+                    break
+        finally:
+            if master is not None:
+                master.close()
+            self.communicate.PortScanned.emit(port, found)
+            with self._lock:
+                self._running -= 1
+                finished = self._running == 0
+            if finished:
+                self.communicate.Finished.emit()
+
+    def scan_baudrate(self, master, port: str, baudrate: int):
+        master._serial.baudrate = baudrate
+        timeouts = ResponseTimeouts(baudrate, initial=self.turnaround)
+        found = 0
+        for slave in self.slaves:
+            if self._stopped.is_set():
+                break
+            master.set_timeout(timeouts.timeout(slave, cst.READ_DISCRETE_INPUTS, 0, 1))
+            try:
+                master.execute(slave, cst.READ_DISCRETE_INPUTS, 0, 1)
+            except ModbusError:
+                # Ответ-исключение: устройство на этом адресе есть
+                pass
+            except Exception:
+                continue
+            found += 1
+            with self._lock:
+                self.results.append((port, baudrate, slave))
+            self.communicate.DeviceFound.emit(port, baudrate, slave)
+        return found
@@ -0,0 +1,113 @@
+# Коэффициент сглаживания достигнутой частоты обновления устройства
+RATE_SMOOTHING = 0.2
+
+
+class DeviceShare:
+    def __init__(self):
+        # Метки SFQ: начало и конец последнего обслуживания в виртуальном времени
+        self.start = 0.0
+        self.finish = 0.0
+        self.last_update = None
+        self.rate = None
+        self.served = 0
+        self.deferred = 0
+        self.max_seen_staleness = 0.0
+        self.violations = 0
+
+    def staleness(self, now: float):
+        if self.last_update is None:
+            return None
+        return now - self.last_update
+
+
+# Распределение времени линии между устройствами взвешенной справедливой очередью
+# (start-time fair queueing). Стоимость устройства на цикле - ожидаемое время обмена по
+# его плану чтения; виртуальное время устройства растёт на стоимость / вес, и на цикле
+# первыми обслуживаются устройства с меньшей меткой начала. Устройство, которому грозит
+# превышение max_staleness, обслуживается вне очереди. Пока весь план помещается в
+# бюджет цикла, обслуживаются все устройства, как и без распределения.
+class FairScheduler:
+    def __init__(self):
+        self.virtual_time = 0.0
+        self.shares = {}
+
+    def share(self, device):
+        share = self.shares.get(device)
+        if share is None:
+            share = self.shares[device] = DeviceShare()
+        return share
+
+    # candidates - список (устройство, стоимость); возвращает устройства, которые
+    # обслуживаются на этом цикле, в порядке обслуживания
+    def select(self, candidates, now: float, budget: float, interval: float):
+        costs = dict(candidates)
+        if sum(costs.values()) <= budget:
+            selected = [(device, False) for device in costs]
+        else:
+            urgent = []
+            queued = []
+            for device, cost in candidates:
+                share = self.share(device)
+                start = max(self.virtual_time, share.finish)
+                slack = self.slack(device, share, now, interval + cost)
+                if slack is not None and slack <= 0:
+                    urgent.append((slack, id(device), device))
+                else:
+                    # При равном начале первым идёт устройство, которое раньше закончит
+                    queued.append((start, start + cost / device.weight, id(device), device))
+            urgent.sort(key=lambda item: item[:2])
+            queued.sort(key=lambda item: item[:3])
+            order = [(item[-1], True) for item in urgent] + [(item[-1], False) for item in queued]
+            selected = []
+            spent = 0.0
+            for device, out_of_turn in order:
+                # Хотя бы одно устройство обслуживается, даже если его план больше бюджета
+                if selected and spent + costs[device] > budget:
+                    self.share(device).deferred += 1
+                    continue
+                selected.append((device, out_of_turn))
+                spent += costs[device]
+        for device, out_of_turn in selected:
+            share = self.share(device)
+            share.start = max(self.virtual_time, share.finish)
+            share.finish = share.start + costs[device] / device.weight
+            # Обслуживание вне очереди списывается с устройства, но не сдвигает
+            # виртуальное время остальных
+            if not out_of_turn:
+                self.virtual_time = max(self.virtual_time, share.start)
+            share.served += 1
+        return [device for device, _ in selected]
+
+    # Запас времени до нарушения max_staleness, если пропустить устройство на этом цикле
+    # (delay - через сколько устройство будет обновлено на следующем цикле)
+    def slack(self, device, share, now: float, delay: float):
+        if device.max_staleness is None or share.last_update is None:
+            return None
+        return device.max_staleness - (now - share.last_update + delay)
+
+    # Устройство ответило: обновляются достигнутая частота и устаревание
+    def updated(self, device, now: float):
+        share = self.share(device)
+        if share.last_update is not None:
+            staleness = now - share.last_update
+            share.max_seen_staleness = max(share.max_seen_staleness, staleness)
+            if device.max_staleness is not None and staleness > device.max_staleness:
+                share.violations += 1
+            if staleness > 0:
+                rate = 1.0 / staleness
+                share.rate = rate if share.rate is None else share.rate + RATE_SMOOTHING * (rate - share.rate)
+        share.last_update = now
+
+    def forget(self, device):
+        self.shares.pop(device, None)
+
+    def statistics(self, now: float):
+        return {device.slave: {'weight': device.weight,
+                               'max_staleness': device.max_staleness,
+                               'rate': share.rate,
+                               'staleness': share.staleness(now),
+                               'max_seen_staleness': share.max_seen_staleness,
+                               'violations': share.violations,
+                               'served': share.served,
+                               'deferred': share.deferred}
+                for device, share in self.shares.items()}
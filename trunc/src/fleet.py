@@ -0,0 +1,405 @@
+import itertools
+import multiprocessing
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+from PyQt5.QtCore import Qt
+from modbus_tk.modbus import ModbusError
+from sunline import SunlineBus, Communicate
+from health import DeviceHealth, DEVICE_OFFLINE
+from snapshot import RegisterSnapshot
+
+# Период, с которым процесс линии отправляет изменившиеся значения, с
+FLEET_PUBLISH_INTERVAL = 0.05
+# Пауза перед перезапуском упавшего процесса линии, с
+FLEET_RESTART_DELAY = 1.0
+# Изменение значения: номер регистра в линии и значение
+UPDATE_STRUCT = struct.Struct('<Hi')
+
+MSG_VALUES = 0
+MSG_HEALTH = 1
+MSG_ERROR = 2
+MSG_RESULT = 3
+MSG_WRITE = 4
+MSG_STOP = 5
+MSG_CALL = 6
+MSG_COMMIT_ERROR = 7
+
+# Адресат вызова MSG_CALL: линия или номер устройства
+CALL_BUS = -1
+
+
+# ModbusError не восстанавливается из своих args при передаче в другой процесс
+def transferable(error):
+    if isinstance(error, ModbusError):
+        error.args = (error.get_exception_code(),)
+    return error
+
+
+def register_names(device_class):
+    return [reg[0] for reg in device_class.discrete_input_list + device_class.coil_list +
+            device_class.input_register_list + device_class.holding_register_list]
+
+
+# Процесс линии: свой SunlineBus с циклами опроса и записи. Изменившиеся значения
+# отправляются координатору одним блоком (номер регистра, значение) раз в publish_interval,
+# а если задан сегмент snapshot - публикуются в нём целиком. Команды записи и вызовы
+# методов линии и устройств приходят обратно по тому же каналу.
+def run_bus(conn, port, baudrate, devices, options, snapshot=None, publish_interval=FLEET_PUBLISH_INTERVAL):
+    bus = SunlineBus(port, baudrate, **options)
+    units = [device_class(bus=bus, slave=slave) for device_class, slave in devices]
+    regs = [reg for device in units for reg in device.regs]
+    last = [None] * len(regs)
+    events = deque()
+    for index, device in enumerate(units):
+        communicate = device.communicate
+        # Прямое соединение: в процессе линии нет цикла событий Qt
+        communicate.ErrorReadingRegister.connect(
+            lambda message, index=index: events.append((MSG_ERROR, index, message)), Qt.DirectConnection)
+        communicate.ErrorCommitingRegister.connect(
+            lambda message, index=index: events.append((MSG_COMMIT_ERROR, index, message)), Qt.DirectConnection)
+        communicate.HealthChanged.connect(
+            lambda state, index=index: events.append((MSG_HEALTH, index, state)), Qt.DirectConnection)
+        # Перезапущенный процесс сообщает начальное состояние связи заново
+        events.append((MSG_HEALTH, index, device.health.state))
+    if snapshot is not None:
+        snapshot = RegisterSnapshot(name=snapshot)
+
+    # Вызов может ждать обмена с устройством, поэтому идёт в отдельном потоке,
+    # а результат отправляет основной цикл
+    def call(request, target, method, args):
+        try:
+            result = getattr(bus if target == CALL_BUS else units[target], method)(*args)
+        except Exception as e:
+            events.append((MSG_RESULT, request, None, transferable(e)))
+        else:
+            events.append((MSG_RESULT, request, result, None))
+
+    # Запись завершена, когда её правка ушла в устройство или запись не прошла
+    def written(request, future):
+        error = future.exception()
+        events.append((MSG_RESULT, request, None if error is not None else future.result(),
+                       transferable(error) if error is not None else None))
+
+    bus.start()
+    try:
+        while True:
+            if conn.poll(publish_interval):
+                message = conn.recv()
+                if message[0] == MSG_STOP:
+                    break
+                if message[0] == MSG_WRITE:
+                    _, request, index, value = message
+                    regs[index].value = value
+                    regs[index].wait_written().add_done_callback(
+                        lambda future, request=request: written(request, future))
+                elif message[0] == MSG_CALL:
+                    threading.Thread(target=call, args=message[1:], daemon=True).start()
+            changes = []
+            for index, reg in enumerate(regs):
+                value = reg.__value__
+                if value is not None and value != last[index]:
+                    last[index] = value
+                    changes.append(UPDATE_STRUCT.pack(index, value))
+            if changes:
+                if snapshot is not None:
+                    snapshot.publish(last)
+                else:
+                    conn.send((MSG_VALUES, b''.join(changes)))
+            while events:
+                conn.send(events.popleft())
+    except (EOFError, OSError):
+        # Координатор завершился
+        pass
+    finally:
+        bus.stop()
+        if snapshot is not None:
+            snapshot.close()
+
+
+# Регистр устройства в процессе координатора, с тем же value, что у Register:
+# чтение возвращает последнее опубликованное значение или ещё не записанное новое,
+# присваивание отправляет запись в процесс линии
+class FleetRegister:
+    def __init__(self, device, name: str):
+        self.device = device
+        self.name = name
+        self.__commit_buffer__ = None
+
+    def __get_value__(self):
+        if self.__commit_buffer__ is not None:
+            return self.__commit_buffer__
+        value = self.device.values[self.name]
+        if value is None:
+            self.device.communicate.ErrorReadingRegister.emit('Reg value is None')
+            return -1
+        return value
+
+    def __set_value__(self, value: int):
+        if self.__commit_buffer__ == value:
+            return
+        self.__commit_buffer__ = value
+        self.device.write(self.name, value).add_done_callback(lambda f: self.__commit_done__(value))
+
+    def __commit_done__(self, value):
+        if self.__commit_buffer__ == value:
+            self.__commit_buffer__ = None
+
+    def __get_modified__(self):
+        return self.__commit_buffer__ is not None
+
+    value = property(__get_value__, __set_value__)
+    modified = property(__get_modified__)
+
+
+class FleetBusProxy:
+    def __init__(self, line):
+        self.line = line
+
+    @property
+    def port(self):
+        return self.line.port
+
+    def reconfigure(self, port: str = None, baudrate: int = None):
+        self.line.call(CALL_BUS, 'reconfigure', port, baudrate).result()
+        if port is not None:
+            self.line.port = port
+        if baudrate is not None:
+            self.line.baudrate = baudrate
+
+
+# Зеркало устройства в процессе координатора: регистры и сигналы как у SunlineDevice,
+# запись и вызовы уходят в процесс линии
+class FleetDevice:
+    def __init__(self, line, index: int, device_class, slave: int):
+        self.line = line
+        self.index = index
+        self._slave = slave
+        self.communicate = Communicate()
+        # Состояние связи, которое сообщил процесс линии; тот же тип, что у SunlineDevice.health
+        self.health = DeviceHealth()
+        self.values = dict.fromkeys(register_names(device_class))
+        self.regs = {name: FleetRegister(self, name) for name in self.values}
+        self.bus = FleetBusProxy(line)
+
+    @property
+    def slave(self):
+        return self._slave
+
+    @slave.setter
+    def slave(self, slave: int):
+        self.line.call(self.index, '__setattr__', 'slave', slave).result()
+        self._slave = slave
+
+    def __getitem__(self, name: str):
+        return self.regs.get(name)
+
+    def write(self, name: str, value: int):
+        return self.line.write(self, name, value)
+
+    def execute(self, *args, timeout=None):
+        return self.line.call(self.index, 'execute', *args).result(timeout)
+
+    # Останавливает весь парк, к которому относится устройство
+    def stop(self):
+        self.line.fleet.stop()
+
+
+class FleetLine:
+    def __init__(self, fleet, port, baudrate, devices, options, shared=False):
+        self.fleet = fleet
+        self.port = port
+        self.baudrate = baudrate
+        self.specs = list(devices)
+        self.options = options
+        self.devices = [FleetDevice(self, index, device_class, slave)
+                        for index, (device_class, slave) in enumerate(self.specs)]
+        self.registers = [(device, name) for device in self.devices for name in device.values]
+        self.indexes = {register: index for index, register in enumerate(self.registers)}
+        # Значения приходят через разделяемую память, а не через канал
+        self.snapshot = RegisterSnapshot(len(self.registers)) if shared else None
+        self.sequence = 0
+        self.process = None
+        self.conn = None
+        self.dead_at = None
+        self.pending = {}
+        self._requests = itertools.count()
+        self._lock = threading.Lock()
+
+    def start(self, context):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=run_bus, daemon=True,
+                                       args=(child, self.port, self.baudrate, self.specs, self.options,
+                                             self.snapshot.name if self.snapshot is not None else None))
+        self.process.start()
+        child.close()
+        self.dead_at = None
+
+    def send(self, message_type, *args):
+        future = Future()
+        with self._lock:
+            request = next(self._requests)
+            self.pending[request] = future
+            try:
+                self.conn.send((message_type, request) + args)
+            except (OSError, AttributeError) as e:
+                del self.pending[request]
+                future.set_exception(ConnectionError('Line %s is not running: %s' % (self.port, e)))
+        return future
+
+    def write(self, device, name: str, value: int):
+        return self.send(MSG_WRITE, self.indexes[(device, name)], int(value))
+
+    def call(self, target: int, method: str, *args):
+        return self.send(MSG_CALL, target, method, args)
+
+    def handle(self, message):
+        kind = message[0]
+        if kind == MSG_VALUES:
+            updated = set()
+            for index, value in UPDATE_STRUCT.iter_unpack(message[1]):
+                device, name = self.registers[index]
+                device.values[name] = value
+                updated.add(device)
+            for device in updated:
+                device.communicate.RegistersUpdated.emit()
+        elif kind == MSG_HEALTH:
+            device = self.devices[message[1]]
+            if device.health.state != message[2]:
+                device.health.state = message[2]
+                device.communicate.HealthChanged.emit(message[2])
+        elif kind == MSG_ERROR:
+            self.devices[message[1]].communicate.ErrorReadingRegister.emit(message[2])
+        elif kind == MSG_COMMIT_ERROR:
+            self.devices[message[1]].communicate.ErrorCommitingRegister.emit(message[2])
+        elif kind == MSG_RESULT:
+            _, request, result, error = message
+            with self._lock:
+                future = self.pending.pop(request, None)
+            if future is None:
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    # Новый снимок из разделяемой памяти переносится в значения устройств
+    def read_snapshot(self):
+        if self.snapshot is None or self.snapshot.sequence == self.sequence:
+            return
+        snapshot = self.snapshot.read()
+        if snapshot is None:
+            # Процесс линии упал посреди записи; перезапущенный допишет снимок заново
+            return
+        self.sequence, values = snapshot
+        updated = set()
+        for (device, name), value in zip(self.registers, values):
+            if device.values[name] != value:
+                device.values[name] = value
+                updated.add(device)
+        for device in updated:
+            device.communicate.RegistersUpdated.emit()
+
+    # Процесс линии завершился: устройства отключены, ожидающие записи отменяются
+    def died(self):
+        with self._lock:
+            self.conn.close()
+            self.conn = None
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError('Line %s process exited' % self.port))
+        for device in self.devices:
+            if device.health.state != DEVICE_OFFLINE:
+                device.health.state = DEVICE_OFFLINE
+                device.communicate.HealthChanged.emit(DEVICE_OFFLINE)
+        self.dead_at = time.monotonic()
+
+    def stop(self):
+        with self._lock:
+            if self.conn is not None:
+                try:
+                    self.conn.send((MSG_STOP,))
+                except OSError:
+                    pass
+        if self.process is not None:
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot.unlink()
+            self.snapshot = None
+
+
+# Парк линий: по процессу на каждый последовательный порт, чтобы опрос разных линий
+# не делил одну GIL и зависший драйвер одного адаптера не останавливал остальные.
+# Координатор (этот процесс) получает изменения значений и отправляет записи
+# в процесс нужной линии; упавший процесс линии перезапускается.
+class Fleet:
+    def __init__(self, restart_delay: float = FLEET_RESTART_DELAY, publish_interval: float = FLEET_PUBLISH_INTERVAL):
+        self.restart_delay = restart_delay
+        self.publish_interval = publish_interval
+        self.lines = []
+        # Процессы линий не наследуют потоки и Qt координатора
+        self.context = multiprocessing.get_context('spawn')
+        self._reader = None
+        self._stopped = False
+
+    # devices: [(класс устройства, адрес), ...]; options передаются в SunlineBus.
+    # С shared=True значения публикуются в разделяемой памяти (см. snapshot.RegisterSnapshot).
+    def add_line(self, port, baudrate, devices, shared=False, **options):
+        line = FleetLine(self, port, baudrate, devices, options, shared)
+        self.lines.append(line)
+        return line.devices
+
+    def start(self):
+        self._stopped = False
+        for line in self.lines:
+            line.start(self.context)
+        self._reader = threading.Thread(target=self.run, daemon=True)
+        self._reader.start()
+
+    def run(self):
+        while not self._stopped:
+            lines = {line.conn: line for line in self.lines if line.conn is not None}
+            timeout = self.publish_interval if any(line.snapshot is not None for line in self.lines) else 0.5
+            for conn in wait(list(lines), timeout=timeout) if lines else ():
+                line = lines[conn]
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    if not self._stopped:
+                        line.died()
+                    continue
+                line.handle(message)
+            if not lines:
+                time.sleep(timeout)
+            now = time.monotonic()
+            for line in self.lines:
+                if self._stopped:
+                    break
+                line.read_snapshot()
+                if line.dead_at is not None and now - line.dead_at >= self.restart_delay:
+                    line.start(self.context)
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        if self._reader is not None:
+            self._reader.join()
+        for line in self.lines:
+            line.stop()
+
+
+# Движок опроса одного устройства в отдельном процессе для GUI: опрос не делит GIL
+# с перерисовкой окна, а GUI читает значения из снимка в разделяемой памяти и
+# никогда не ждёт порт. Возвращает FleetDevice с тем же интерфейсом, что у устройства.
+def start_engine(port, baudrate, device_class, slave: int = 1, **options):
+    fleet = Fleet()
+    device, = fleet.add_line(port, baudrate, [(device_class, slave)], shared=True, **options)
+    fleet.start()
+    return device
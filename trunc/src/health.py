@@ -0,0 +1,63 @@
+from modbus_tk.modbus import ModbusInvalidResponseError
+
+DEVICE_HEALTHY = 'healthy'
+DEVICE_SUSPECT = 'suspect'
+DEVICE_OFFLINE = 'offline'
+
+# Ошибки, после которых ясно, что устройство не ответило вовсе.
+# Ответ-исключение Modbus (ModbusError) означает, что устройство на связи.
+# ConnectionError - порт закрыт или адаптер отключён: запрос вовсе не ушёл в линию.
+NO_RESPONSE_ERRORS = (ModbusInvalidResponseError, TimeoutError, ConnectionError)
+
+
+# Состояние связи с устройством: healthy -> suspect после цикла без ответа,
+# suspect -> offline после offline_after таких циклов подряд. Отключённое устройство
+# не опрашивается, а проверяется одним коротким запросом с экспоненциально растущей паузой.
+class DeviceHealth:
+    def __init__(self, offline_after: int = 3, probe_delay: float = 0.5, max_probe_delay: float = 30):
+        self.offline_after = offline_after
+        self.probe_delay = probe_delay
+        self.max_probe_delay = max_probe_delay
+        self.state = DEVICE_HEALTHY
+        self.failures = 0
+        self.next_probe = 0
+        self._backoff = probe_delay
+
+    @property
+    def offline(self):
+        return self.state == DEVICE_OFFLINE
+
+    def probe_due(self, now: float):
+        return self.offline and now >= self.next_probe
+
+    # Оба метода возвращают новое состояние, если оно изменилось, иначе None
+    def succeeded(self):
+        changed = self.state != DEVICE_HEALTHY
+        self.state = DEVICE_HEALTHY
+        self.failures = 0
+        self._backoff = self.probe_delay
+        return self.state if changed else None
+
+    # Порт потерян: устройство недоступно сразу, без циклов ожидания, и проверяется
+    # первым же запросом после восстановления порта
+    def disconnected(self):
+        changed = self.state != DEVICE_OFFLINE
+        self.state = DEVICE_OFFLINE
+        self.failures = max(self.failures, self.offline_after)
+        self.next_probe = 0
+        self._backoff = self.probe_delay
+        return self.state if changed else None
+
+    def failed(self, now: float):
+        self.failures += 1
+        if self.offline:
+            self._backoff = min(self._backoff * 2, self.max_probe_delay)
+            self.next_probe = now + self._backoff
+            return None
+        previous = self.state
+        if self.failures >= self.offline_after:
+            self.state = DEVICE_OFFLINE
+            self.next_probe = now + self._backoff
+        else:
+            self.state = DEVICE_SUSPECT
+        return self.state if self.state != previous else None
@@ -0,0 +1,130 @@
+import time
+import modbus_tk.defines as cst
+from modbus_tk.modbus import ModbusError
+from health import NO_RESPONSE_ERRORS
+from modbus_io import PRIORITY_WRITE, PRIORITY_CONFIG
+from transport import is_network
+
+# Скорости, которые пробуются при повышении скорости линии (в порядке убывания)
+UPGRADE_RATES = (57600, 38400, 28800)
+# Сколько секунд линия должна проработать без единой ошибки на новой скорости
+SOAK_TIME = 5
+# Попыток опроса устройства сразу после смены скорости: первый кадр может прийти искажённым
+PROBE_ATTEMPTS = 3
+
+
+def slaves(devices):
+    return ', '.join(str(device.slave) for device in devices)
+
+
+def write_baudrate(bus, device, baudrate: int, register: str):
+    reg = device[register]
+    try:
+        bus.execute(device.slave, cst.WRITE_MULTIPLE_REGISTERS, reg.address, output_value=[baudrate],
+                    priority=PRIORITY_WRITE)
+    except Exception:
+        return False
+    reg.written(baudrate)
+    return True
+
+
+def probe(bus, device):
+    request = device.probe_request
+    for _ in range(PROBE_ATTEMPTS):
+        try:
+            bus.execute(device.slave, request.funcode, request.address, request.count, priority=PRIORITY_CONFIG)
+        except ModbusError:
+            return True
+        except Exception:
+            continue
+        return True
+    return False
+
+
+# Полный опрос всех устройств в течение duration секунд; возвращает число ошибок (до первой).
+# Ошибкой линии считается только кадр, который не пришёл или пришёл битым (CRC, длина,
+# адрес - ModbusInvalidResponseError). Ответ-исключение Modbus принят на новой скорости.
+def soak(bus, devices, duration: float):
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        for device in devices:
+            for name, futures in device.submit_reads():
+                for request, future in futures:
+                    try:
+                        future.result()
+                    except NO_RESPONSE_ERRORS:
+                        return 1
+                    except ModbusError:
+                        continue
+    return 0
+
+
+# Переводит устройства обратно на скорость baudrate, начиная с текущей скорости порта.
+# Устройства, которые не ответили на текущей скорости, проверяются на исходной:
+# возможно, они так и не переключились.
+def roll_back(bus, devices, baudrate: int, register: str):
+    for device in devices:
+        if probe(bus, device):
+            write_baudrate(bus, device, baudrate, register)
+    bus.set_baudrate(baudrate)
+    return [device for device in devices if not probe(bus, device)]
+
+
+# Повышение скорости линии через регистр скорости RS-485: регистр записывается во все
+# устройства на текущей скорости, порт переоткрывается на новой, каждое устройство
+# проверяется, затем линия опрашивается soak_time секунд. При любой ошибке все устройства
+# возвращаются на исходную скорость и пробуется следующая скорость из rates.
+# Пока хотя бы одно устройство линии отключено, скорость не меняется.
+# Возвращает выбранную скорость и список устройств, с которыми потеряна связь
+# (или отключённых устройств, из-за которых скорость не менялась).
+def upgrade_link_speed(bus, rates=UPGRADE_RATES, soak_time: float = SOAK_TIME, register: str = 'RS485_BAUD',
+                       progress=None):
+    def report(message):
+        if progress is not None:
+            progress(message)
+
+    # Скорость линии за шлюзом задаётся в самом шлюзе: записанная в устройства скорость
+    # оставила бы их без связи
+    if is_network(bus.port):
+        raise Exception('Link speed of %s is set on the gateway' % bus.port)
+    original = bus.baudrate
+    devices = [device for device in bus.devices if device[register] is not None]
+    # Отключённое устройство не узнает о новой скорости и останется на старой без связи
+    offline = [device for device in devices if device.health.offline]
+    if offline:
+        report('Нет связи с устройствами: %s. Скорость линии оставлена %d бод' %
+               (slaves(offline), original))
+        return original, offline
+    lost = []
+    bus.pause()
+    try:
+        for baudrate in sorted(rates, reverse=True):
+            if baudrate <= original:
+                break
+            report('Переход на %d бод' % baudrate)
+            switched = [device for device in devices if write_baudrate(bus, device, baudrate, register)]
+            bus.set_baudrate(baudrate)
+            silent = [device for device in switched if not probe(bus, device)]
+            if not silent and len(switched) == len(devices):
+                errors = soak(bus, devices, soak_time)
+                if not errors:
+                    report('Скорость линии %d бод' % baudrate)
+                    return baudrate, lost
+                report('Ошибки обмена на %d бод' % baudrate)
+            else:
+                unswitched = [device for device in devices if device not in switched]
+                if unswitched:
+                    report('Не удалось записать скорость %d бод в устройства: %s' % (baudrate, slaves(unswitched)))
+                if silent:
+                    report('На %d бод не ответили устройства: %s' % (baudrate, slaves(silent)))
+            failed = roll_back(bus, devices, original, register)
+            if failed:
+                # Следующая скорость оставила бы потерянные устройства на старой: пробы прекращаются
+                report('Нет связи после возврата скорости: %s' % slaves(failed))
+                lost.extend(failed)
+                break
+        bus.set_baudrate(original)
+        report('Скорость линии оставлена %d бод' % original)
+        return original, lost
+    finally:
+        bus.resume()
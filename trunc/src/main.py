@@ -68,12 +68,19 @@ class MyMainWindow(QtWidgets.QMainWindow):
         if e.key() == Qt.Key_Escape:
             self.close()
 
-try:
-    app = QtWidgets.QApplication(sys.argv)
-    app.setStyle(QStyleFactory.keys()[3])
-    MainWindow = MyMainWindow()
-    MainWindow.show()
-
-    sys.exit(app.exec_())
-except Exception as e:
-    print(e)
+
+def main():
+    try:
+        app = QtWidgets.QApplication(sys.argv)
+        app.setStyle(QStyleFactory.keys()[3])
+        MainWindow = MyMainWindow()
+        MainWindow.show()
+
+        sys.exit(app.exec_())
+    except Exception as e:
+        print(e)
+
+
+# Процессы опроса (fleet, spawn) импортируют главный модуль заново: окно создаётся только при запуске
+if __name__ == '__main__':
+    main()
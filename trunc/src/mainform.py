@@ -1695,6 +1695,7 @@ class Ui_MainWindow(object):
         self.at.communicate.RegistersUpdated.connect(self.update_controls)
         self.at.communicate.ErrorReadingRegister.connect(self.reg_error_read_handler)
         self.at.communicate.ErrorCommitingRegister.connect(self.display_message)
+        self.at.communicate.HealthChanged.connect(self.health_changed_handler)
 
         self.actShowHideDockWidget.triggered.connect(self.dock_show_hide)
         self.actExit.triggered.connect(self.close_app)
@@ -1721,6 +1722,12 @@ class Ui_MainWindow(object):
     def reg_error_read_handler(self, message):
         self.textBrowser.log(message)
 
+    def health_changed_handler(self, state):
+        messages = {'healthy': 'Связь с устройством восстановлена',
+                    'suspect': 'Устройство не отвечает',
+                    'offline': 'Нет связи с устройством, опрос приостановлен'}
+        self.textBrowser.log(messages.get(state, state))
+
     def connect(self):
         connect_dialog = Ui_Dialog(self.at)
         connect_dialog.exec()
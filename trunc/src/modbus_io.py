@@ -0,0 +1,229 @@
+import itertools
+import time
+from concurrent.futures import Future
+from queue import PriorityQueue
+from threading import Thread, Lock
+from modbus_tk.modbus import ModbusInvalidResponseError
+
+# Приоритеты транзакций: чем меньше число, тем раньше транзакция уйдёт в порт
+PRIORITY_WRITE = 0
+PRIORITY_ALARM = 1
+PRIORITY_POLL = 2
+PRIORITY_CONFIG = 3
+
+
+class Transaction:
+    def __init__(self, priority: int, args, kwargs):
+        self.priority = priority
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        # Служебная операция с портом вместо запроса к устройству
+        self.proc = None
+
+
+# Единственный поток, который работает с портом. Все запросы к устройствам
+# ставятся в очередь с приоритетом, результат возвращается через Future.
+class ModbusWorker(Thread):
+    def __init__(self, master, reconnect_delay=0.1, max_reconnect_delay=10, timeouts=None):
+        Thread.__init__(self, daemon=True)
+        self.master = master
+        self.queue = PriorityQueue()
+        self._counter = itertools.count()
+        self._stopped = False
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.connected = True
+        self._backoff = reconnect_delay
+        self._retry_at = 0
+        # Суммарное время, которое порт был занят обменом, с
+        self.busy_time = 0.0
+        # Адаптивные таймауты ответа (timeouts.ResponseTimeouts); None - таймаут мастера
+        self.timeouts = timeouts
+
+    def submit(self, priority: int, *args, **kwargs):
+        transaction = Transaction(priority, args, kwargs)
+        if self._stopped:
+            transaction.future.cancel()
+        else:
+            # Счётчик сохраняет порядок FIFO внутри одного приоритета
+            self.queue.put((priority, next(self._counter), transaction))
+        return transaction.future
+
+    def execute(self, *args, priority: int = PRIORITY_POLL, **kwargs):
+        return self.submit(priority, *args, **kwargs).result()
+
+    # Выполняет proc() в потоке порта между транзакциями: только так можно
+    # переоткрыть или перенастроить порт, не мешая обмену
+    def call(self, proc, priority: int = PRIORITY_WRITE):
+        transaction = Transaction(priority, (), {})
+        transaction.proc = proc
+        if self._stopped:
+            transaction.future.cancel()
+        else:
+            self.queue.put((priority, next(self._counter), transaction))
+        return transaction.future
+
+    def run(self):
+        while True:
+            _, _, transaction = self.queue.get()
+            if transaction is None:
+                break
+            self.process(transaction)
+        self.cancel_pending()
+
+    def process(self, transaction: Transaction):
+        if not transaction.future.set_running_or_notify_cancel():
+            return
+        if transaction.proc is not None:
+            self.process_call(transaction)
+            return
+        if not self.ensure_connected():
+            transaction.future.set_exception(ConnectionError('Connection is not established'))
+            return
+        if self.timeouts is not None:
+            timeout = self.timeouts.timeout(*transaction.args, **transaction.kwargs)
+            if timeout != self.master.get_timeout():
+                self.master.set_timeout(timeout)
+        started = time.monotonic()
+        try:
+            result = self.master.execute(*transaction.args, **transaction.kwargs)
+        except TimeoutError as e:
+            # Устройство не ответило, но соединение при этом живо
+            self.expired(transaction)
+            transaction.future.set_exception(e)
+        except OSError as e:
+            self.connection_lost()
+            transaction.future.set_exception(e)
+        except ModbusInvalidResponseError as e:
+            # Мастер RTU сообщает так о пустом или обрезанном ответе
+            self.expired(transaction)
+            transaction.future.set_exception(e)
+        except Exception as e:
+            transaction.future.set_exception(e)
+        else:
+            if self.timeouts is not None:
+                self.timeouts.observe(time.monotonic() - started, *transaction.args, **transaction.kwargs)
+            transaction.future.set_result(result)
+        finally:
+            self.busy_time += time.monotonic() - started
+
+    def expired(self, transaction: Transaction):
+        if self.timeouts is not None:
+            self.timeouts.expired(*transaction.args, **transaction.kwargs)
+
+    def process_call(self, transaction: Transaction):
+        try:
+            result = transaction.proc()
+        except Exception as e:
+            transaction.future.set_exception(e)
+        else:
+            transaction.future.set_result(result)
+
+    # Повторное подключение с экспоненциально растущей паузой, чтобы
+    # недоступный шлюз или выдернутый адаптер не занимали поток целиком
+    def ensure_connected(self):
+        if self.connected:
+            return True
+        if time.monotonic() < self._retry_at:
+            return False
+        try:
+            self.master.open()
+        except OSError:
+            self._retry_at = time.monotonic() + self._backoff
+            self._backoff = min(self._backoff * 2, self.max_reconnect_delay)
+            return False
+        self.connected = True
+        self._backoff = self.reconnect_delay
+        return True
+
+    # Немедленная попытка подключения без ожидания паузы, например когда
+    # адаптер снова появился в системе
+    def reconnect(self):
+        self._retry_at = 0
+        self._backoff = self.reconnect_delay
+        if not self.ensure_connected():
+            raise ConnectionError('Connection is not established')
+
+    def connection_lost(self):
+        try:
+            self.master.close()
+        except OSError:
+            pass
+        self.connected = False
+        self._retry_at = time.monotonic() + self._backoff
+
+    def cancel_pending(self):
+        while not self.queue.empty():
+            _, _, transaction = self.queue.get_nowait()
+            if transaction is not None:
+                transaction.future.cancel()
+
+    def stop(self):
+        self._stopped = True
+        # Приоритет -1 ставит признак остановки впереди всех транзакций
+        self.queue.put((-1, next(self._counter), None))
+
+
+# Поток порта для клиентов с конвейером запросов: транзакция передаётся клиенту
+# без ожидания ответа, так что в соединении одновременно находится несколько запросов.
+class PipelinedWorker(ModbusWorker):
+    def __init__(self, master, **kwargs):
+        ModbusWorker.__init__(self, master, **kwargs)
+        # Линия занята, пока в соединении есть хотя бы один запрос: время перекрывающихся
+        # запросов в busy_time не суммируется
+        self._in_flight = 0
+        self._busy_since = 0.0
+        self._busy_lock = Lock()
+
+    def begin(self):
+        with self._busy_lock:
+            if self._in_flight == 0:
+                self._busy_since = time.monotonic()
+            self._in_flight += 1
+
+    def end(self):
+        with self._busy_lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self.busy_time += time.monotonic() - self._busy_since
+
+    def process(self, transaction: Transaction):
+        if not transaction.future.set_running_or_notify_cancel():
+            return
+        if transaction.proc is not None:
+            self.process_call(transaction)
+            return
+        if not self.ensure_connected():
+            transaction.future.set_exception(ConnectionError('Connection is not established'))
+            return
+        self.begin()
+        try:
+            inner = self.master.submit(*transaction.args, **transaction.kwargs)
+        except OSError as e:
+            self.end()
+            self.connection_lost()
+            transaction.future.set_exception(e)
+            return
+        except Exception as e:
+            self.end()
+            transaction.future.set_exception(e)
+            return
+        inner.add_done_callback(lambda f: self.complete(transaction.future, f))
+
+    def complete(self, future, inner):
+        self.end()
+        error = inner.exception()
+        if error is None:
+            future.set_result(inner.result())
+            return
+        if isinstance(error, OSError) and not isinstance(error, TimeoutError):
+            self.connection_lost()
+        future.set_exception(error)
+
+
+def make_worker(master, timeouts=None):
+    if getattr(master, 'pipelined', False):
+        # Ответы конвейера приходят вперемешку, таймаут у клиента общий
+        return PipelinedWorker(master)
+    return ModbusWorker(master, timeouts=timeouts)
@@ -0,0 +1,57 @@
+import struct
+import modbus_tk.defines as cst
+from modbus_tk.modbus import ModbusError
+
+
+# Для FC23 address и quantity_of_x задают читаемый диапазон, write_address - начало записи
+def build_pdu(funcode: int, address: int, quantity_of_x: int = 0, output_value=0, write_address: int = 0):
+    if funcode in (cst.READ_COILS, cst.READ_DISCRETE_INPUTS, cst.READ_HOLDING_REGISTERS, cst.READ_INPUT_REGISTERS):
+        return struct.pack('>BHH', funcode, address, quantity_of_x)
+    if funcode == cst.WRITE_SINGLE_COIL:
+        return struct.pack('>BHH', funcode, address, 0xff00 if output_value else 0)
+    if funcode == cst.WRITE_SINGLE_REGISTER:
+        return struct.pack('>BHH', funcode, address, output_value & 0xffff)
+    if funcode == cst.WRITE_MULTIPLE_COILS:
+        data = bytearray((len(output_value) + 7) // 8)
+        for i, bit in enumerate(output_value):
+            if bit:
+                data[i // 8] |= 1 << (i % 8)
+        return struct.pack('>BHHB', funcode, address, len(output_value), len(data)) + bytes(data)
+    if funcode == cst.WRITE_MULTIPLE_REGISTERS:
+        return struct.pack('>BHHB', funcode, address, len(output_value), 2 * len(output_value)) + \
+               struct.pack('>%dH' % len(output_value), *[value & 0xffff for value in output_value])
+    if funcode == cst.READ_WRITE_MULTIPLE_REGISTERS:
+        return struct.pack('>BHHHHB', funcode, address, quantity_of_x, write_address,
+                           len(output_value), 2 * len(output_value)) + \
+               struct.pack('>%dH' % len(output_value), *[value & 0xffff for value in output_value])
+    raise ValueError('Function code %d is not supported' % funcode)
+
+
+# Полная длина кадра запроса: адрес + PDU + CRC
+def request_length(funcode: int, quantity_of_x: int = 0, output_value=0):
+    if funcode == cst.WRITE_MULTIPLE_COILS:
+        return 9 + (len(output_value) + 7) // 8
+    if funcode == cst.WRITE_MULTIPLE_REGISTERS:
+        return 9 + 2 * len(output_value)
+    if funcode == cst.READ_WRITE_MULTIPLE_REGISTERS:
+        return 13 + 2 * len(output_value)
+    return 8
+
+
+# Полная длина кадра ответа: адрес + PDU + CRC
+def response_length(funcode: int, quantity_of_x: int = 0):
+    if funcode in (cst.READ_COILS, cst.READ_DISCRETE_INPUTS):
+        return 5 + (quantity_of_x + 7) // 8
+    if funcode in (cst.READ_HOLDING_REGISTERS, cst.READ_INPUT_REGISTERS, cst.READ_WRITE_MULTIPLE_REGISTERS):
+        return 5 + 2 * quantity_of_x
+    return 8
+
+
+def parse_pdu(funcode: int, quantity_of_x: int, pdu: bytes):
+    if pdu[0] & 0x80:
+        raise ModbusError(pdu[1])
+    if funcode in (cst.READ_COILS, cst.READ_DISCRETE_INPUTS):
+        return tuple((pdu[2 + i // 8] >> (i % 8)) & 1 for i in range(quantity_of_x))
+    if funcode in (cst.READ_HOLDING_REGISTERS, cst.READ_INPUT_REGISTERS, cst.READ_WRITE_MULTIPLE_REGISTERS):
+        return struct.unpack_from('>%dH' % quantity_of_x, pdu, 2)
+    return struct.unpack_from('>HH', pdu, 1)
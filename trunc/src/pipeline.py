@@ -0,0 +1,172 @@
+import itertools
+import select
+import socket
+import struct
+import time
+from concurrent.futures import Future
+from threading import Thread, Lock, Semaphore
+from modbus_tk.modbus import ModbusInvalidResponseError
+from pdu import build_pdu, parse_pdu
+
+
+# Клиент Modbus TCP, который держит в соединении до window запросов одновременно
+# и сопоставляет ответы с запросами по идентификатору транзакции MBAP.
+# Интерфейс open/close/execute совпадает с мастерами modbus_tk.
+class PipelinedTcpClient:
+    pipelined = True
+    # Пауза после широковещательного запроса, пока шлюз передаёт его на линию, с
+    broadcast_turnaround = 0.1
+
+    def __init__(self, host, port=502, window=8, timeout=3):
+        self.host = host
+        self.port = port
+        self.window = window
+        self.timeout = timeout
+        self._sock = None
+        self._slots = Semaphore(window)
+        self._pending = {}
+        self._lock = Lock()
+        self._transaction_id = itertools.count(1)
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def get_timeout(self):
+        return self.timeout
+
+    def open(self):
+        if self._sock is not None:
+            return
+        sock = socket.create_connection((self.host, self.port), self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._sock = sock
+        Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+
+    def close(self):
+        sock = self._sock
+        if sock is not None:
+            self._connection_lost(sock, ConnectionAbortedError('Connection closed'))
+
+    def submit(self, slave, funcode, address, quantity_of_x=0, output_value=0, write_starting_address_fc23=0):
+        self.open()
+        pdu = build_pdu(funcode, address, quantity_of_x, output_value, write_starting_address_fc23)
+        if slave == 0:
+            return self._broadcast(pdu)
+        # Окно заполнено - ждём, пока освободится место под очередной запрос
+        self._slots.acquire()
+        future = Future()
+        future.set_running_or_notify_cancel()
+        # Место в окне освобождает _pop, как только запрос зарегистрирован; до этого - сам submit
+        registered = False
+        try:
+            with self._lock:
+                sock = self._connected_socket()
+                transaction_id = self._next_transaction_id()
+                self._pending[transaction_id] = (future, funcode, quantity_of_x, time.monotonic() + self.timeout)
+                registered = True
+        finally:
+            if not registered:
+                self._slots.release()
+        try:
+            sock.sendall(struct.pack('>HHHB', transaction_id, 0, len(pdu) + 1, slave) + pdu)
+        except OSError as e:
+            self._connection_lost(sock, e)
+        return future
+
+    # Шлюз передаёт unit 0 на линию RS-485 широковещательно и не отвечает. Запрос не занимает
+    # место в окне, а случайный ответ на него отбрасывается как ответ на неизвестную транзакцию.
+    def _broadcast(self, pdu):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            sock = self._connected_socket()
+            transaction_id = self._next_transaction_id()
+        try:
+            sock.sendall(struct.pack('>HHHB', transaction_id, 0, len(pdu) + 1, 0) + pdu)
+        except OSError as e:
+            self._connection_lost(sock, e)
+            future.set_exception(e)
+            return future
+        time.sleep(self.broadcast_turnaround)
+        future.set_result(())
+        return future
+
+    def execute(self, slave, funcode, address, quantity_of_x=0, output_value=0, write_starting_address_fc23=0):
+        return self.submit(slave, funcode, address, quantity_of_x, output_value,
+                           write_starting_address_fc23).result()
+
+    # Вызывается под self._lock: соединение могли закрыть из потока чтения после open()
+    def _connected_socket(self):
+        if self._sock is None:
+            raise ConnectionError('Connection to %s:%d is closed' % (self.host, self.port))
+        return self._sock
+
+    def _next_transaction_id(self):
+        while True:
+            transaction_id = next(self._transaction_id) & 0xffff
+            if transaction_id not in self._pending:
+                return transaction_id
+
+    def _pop(self, transaction_id):
+        with self._lock:
+            entry = self._pending.pop(transaction_id, None)
+        if entry is not None:
+            self._slots.release()
+        return entry
+
+    def _read_loop(self, sock):
+        buffer = b''
+        while self._sock is sock:
+            try:
+                readable, _, _ = select.select([sock], [], [], 0.05)
+                data = sock.recv(4096) if readable else None
+            except (OSError, ValueError) as e:
+                self._connection_lost(sock, e if isinstance(e, OSError) else ConnectionAbortedError(str(e)))
+                return
+            if data == b'':
+                self._connection_lost(sock, ConnectionResetError('Connection closed by %s:%d' % (self.host, self.port)))
+                return
+            if data:
+                buffer += data
+                while len(buffer) >= 7:
+                    transaction_id, _, length = struct.unpack_from('>HHH', buffer)
+                    if len(buffer) < 6 + length:
+                        break
+                    self._resolve(transaction_id, buffer[7:6 + length])
+                    buffer = buffer[6 + length:]
+            self._expire()
+
+    def _resolve(self, transaction_id, pdu):
+        # Ответ на уже просроченный запрос просто отбрасывается
+        entry = self._pop(transaction_id)
+        if entry is None:
+            return
+        future, funcode, quantity_of_x, _ = entry
+        try:
+            future.set_result(parse_pdu(funcode, quantity_of_x, pdu))
+        except Exception as e:
+            future.set_exception(e)
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [transaction_id for transaction_id, entry in self._pending.items() if entry[3] < now]
+        for transaction_id in expired:
+            entry = self._pop(transaction_id)
+            if entry is not None:
+                entry[0].set_exception(ModbusInvalidResponseError('Response timeout'))
+
+    def _connection_lost(self, sock, error):
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+            pending = list(self._pending)
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for transaction_id in pending:
+            entry = self._pop(transaction_id)
+            if entry is not None:
+                entry[0].set_exception(error)
@@ -0,0 +1,156 @@
+import modbus_tk.defines as cst
+
+READ_FUNCCODES = {cst.DISCRETE_INPUTS: cst.READ_DISCRETE_INPUTS,
+                  cst.COILS: cst.READ_COILS,
+                  cst.ANALOG_INPUTS: cst.READ_INPUT_REGISTERS,
+                  cst.HOLDING_REGISTERS: cst.READ_HOLDING_REGISTERS}
+
+# Ограничения спецификации Modbus на количество элементов в одном запросе чтения
+MAX_READ_COUNT = {cst.DISCRETE_INPUTS: 2000,
+                  cst.COILS: 2000,
+                  cst.ANALOG_INPUTS: 125,
+                  cst.HOLDING_REGISTERS: 125}
+
+# Служебные байты кадра RTU: запрос чтения (адрес, функция, старт, кол-во, CRC)
+# и ответ без данных (адрес, функция, счётчик байт, CRC)
+READ_REQUEST_BYTES = 8
+READ_RESPONSE_OVERHEAD = 5
+
+
+def is_bit_table(reg_type: int):
+    return reg_type in (cst.DISCRETE_INPUTS, cst.COILS)
+
+
+def data_bytes(reg_type: int, count: int):
+    if is_bit_table(reg_type):
+        return (count + 7) // 8
+    return 2 * count
+
+
+def char_time(baudrate: int):
+    # 1 старт + 8 данных + 1 стоп (+ 1 бит чётности/второй стоп) = 11 бит на символ
+    return 11.0 / baudrate
+
+
+def frame_gap(baudrate: int):
+    # Пауза t3.5 между кадрами; выше 19200 бод спецификация фиксирует 1.75 мс
+    if baudrate > 19200:
+        return 0.00175
+    return 3.5 * char_time(baudrate)
+
+
+def read_cost(baudrate: int, reg_type: int, count: int, turnaround: float = 0.005):
+    chars = READ_REQUEST_BYTES + READ_RESPONSE_OVERHEAD + data_bytes(reg_type, count)
+    return chars * char_time(baudrate) + 2 * frame_gap(baudrate) + turnaround
+
+
+class ReadRequest:
+    def __init__(self, reg_type: int, address: int, count: int, registers):
+        self.reg_type = reg_type
+        self.funcode = READ_FUNCCODES[reg_type]
+        self.address = address
+        self.count = count
+        self.registers = registers
+
+    def __repr__(self):
+        return 'ReadRequest(%d, %d, %d)' % (self.funcode, self.address, self.count)
+
+
+# Разбивает регистры одной таблицы на минимальный по времени набор запросов чтения.
+# Соседние диапазоны объединяются, если чтение лишних адресов дешевле отдельного кадра.
+# Если передан covered, в запрос попадают все его регистры из прочитанного диапазона:
+# их значения приходят в ответе без дополнительных затрат.
+def plan_reads(registers, baudrate: int, turnaround: float = 0.005, max_count: int = None, covered=None):
+    if not registers:
+        return []
+    reg_type = registers[0].reg_type
+    if max_count is None:
+        max_count = MAX_READ_COUNT[reg_type]
+    registers = sorted(registers, key=lambda reg: reg.address)
+
+    plan = []
+    start = registers[0].address
+    end = start
+    members = [registers[0]]
+    for reg in registers[1:]:
+        merged_count = reg.address - start + 1
+        separate = read_cost(baudrate, reg_type, end - start + 1, turnaround) + \
+                   read_cost(baudrate, reg_type, 1, turnaround)
+        if merged_count <= max_count and \
+                read_cost(baudrate, reg_type, merged_count, turnaround) <= separate:
+            end = reg.address
+            members.append(reg)
+        else:
+            plan.append(ReadRequest(reg_type, start, end - start + 1, members))
+            start = end = reg.address
+            members = [reg]
+    plan.append(ReadRequest(reg_type, start, end - start + 1, members))
+    if covered is not None:
+        for request in plan:
+            request.registers = [reg for reg in covered
+                                 if request.address <= reg.address < request.address + request.count]
+    return plan
+
+
+WRITE_FUNCCODES = {cst.COILS: (cst.WRITE_SINGLE_COIL, cst.WRITE_MULTIPLE_COILS),
+                   cst.HOLDING_REGISTERS: (cst.WRITE_SINGLE_REGISTER, cst.WRITE_MULTIPLE_REGISTERS)}
+
+MAX_WRITE_COUNT = {cst.COILS: 1968,
+                   cst.HOLDING_REGISTERS: 123}
+
+
+class WriteRequest:
+    def __init__(self, reg_type: int, address: int, registers):
+        self.reg_type = reg_type
+        self.address = address
+        self.registers = registers
+        self.values = [int(reg.value) for reg in registers]
+        # Номера правок, с которыми взяты значения: запись подтверждает только их
+        self.generations = [reg.generation for reg in registers]
+        single, multiple = WRITE_FUNCCODES[reg_type]
+        self.funcode = single if len(registers) == 1 else multiple
+
+    @property
+    def count(self):
+        return len(self.registers)
+
+    @property
+    def output_value(self):
+        # FC5/FC6 принимают одно значение, FC15/FC16 - список
+        if self.count == 1:
+            return self.values[0]
+        return self.values
+
+    def __repr__(self):
+        return 'WriteRequest(%d, %d, %s)' % (self.funcode, self.address, self.values)
+
+
+# Строит минимальный набор кадров записи, покрывающий изменённые регистры таблицы.
+# Разрыв между диапазонами не длиннее gap_merge заполняется текущими значениями
+# регистров, но только если все адреса разрыва есть в карте и их значения известны.
+def plan_writes(registers, gap_merge: int = 0, max_count: int = None):
+    dirty = sorted([reg for reg in registers if reg.modified], key=lambda reg: reg.address)
+    if not dirty:
+        return []
+    reg_type = dirty[0].reg_type
+    if max_count is None:
+        max_count = MAX_WRITE_COUNT[reg_type]
+    known = {reg.address: reg for reg in registers
+             if reg.modified or reg.__value__ is not None}
+
+    plan = []
+    members = [dirty[0]]
+    for reg in dirty[1:]:
+        last = members[-1].address
+        if reg.address == last:
+            continue
+        gap = range(last + 1, reg.address)
+        if reg.address - members[0].address < max_count and len(gap) <= gap_merge and \
+                all(address in known for address in gap):
+            members.extend(known[address] for address in gap)
+            members.append(reg)
+        else:
+            plan.append(WriteRequest(reg_type, members[0].address, members))
+            members = [reg]
+    plan.append(WriteRequest(reg_type, members[0].address, members))
+    return plan
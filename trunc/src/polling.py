@@ -0,0 +1,155 @@
+import time
+from modbus_io import PRIORITY_ALARM, PRIORITY_POLL, PRIORITY_CONFIG
+from planner import plan_reads
+
+POLL_FAST = 'fast'
+POLL_NORMAL = 'normal'
+POLL_SLOW = 'slow'
+POLL_ON_DEMAND = 'on_demand'
+
+# Период опроса по умолчанию, с: 0 - на каждом цикле линии, None - только по запросу
+POLL_INTERVALS = {POLL_FAST: 0,
+                  POLL_NORMAL: 1,
+                  POLL_SLOW: 10,
+                  POLL_ON_DEMAND: None}
+
+POLL_PRIORITIES = {POLL_FAST: PRIORITY_ALARM,
+                   POLL_NORMAL: PRIORITY_POLL,
+                   POLL_SLOW: PRIORITY_CONFIG,
+                   POLL_ON_DEMAND: PRIORITY_CONFIG}
+
+# Пределы периода опроса в адаптивном режиме, с: (нижний, верхний)
+ADAPTIVE_LIMITS = {POLL_FAST: (0, 1),
+                   POLL_NORMAL: (0.1, 10),
+                   POLL_SLOW: (1, 60)}
+
+# Наибольший множитель периодов опроса при перегрузке линии: дальше растягивать
+# бесполезно, периоды всё равно упираются в верхние пределы ADAPTIVE_LIMITS
+MAX_STRETCH = 100
+
+# Коэффициент экспоненциального сглаживания скорости изменения и периода опроса
+SMOOTHING = 0.3
+# Сколько раз опрашивать регистр за характерное время между его изменениями
+OVERSAMPLING = 2
+
+# Число закэшированных планов на устройство: набор "созревших" регистров
+# повторяется от цикла к циклу, поэтому план почти всегда берётся из кэша
+PLAN_CACHE_SIZE = 64
+
+
+class PollStats:
+    def __init__(self):
+        self.last_poll = None
+        self.last_value = None
+        # Изменений в секунду и фактический период опроса (сглаженные)
+        self.change_rate = 0.0
+        self.poll_period = None
+        # Период, выбранный адаптивным режимом
+        self.interval = None
+
+
+# Решает, какие регистры пора читать на очередном цикле линии, и строит для них план чтения.
+# В адаптивном режиме период каждого регистра подстраивается под скорость его изменения,
+# а общий множитель stretch растягивает все периоды, когда линия перегружена.
+class PollScheduler:
+    def __init__(self, tables, baudrate: int, intervals: dict, turnaround: float = 0.005,
+                 adaptive: bool = False, limits: dict = None):
+        # tables - список пар (имя таблицы, регистры таблицы)
+        self.tables = tables
+        self.baudrate = baudrate
+        self.intervals = intervals
+        self.turnaround = turnaround
+        self.adaptive = adaptive
+        self.limits = dict(ADAPTIVE_LIMITS)
+        if limits is not None:
+            self.limits.update(limits)
+        self.stretch = 1.0
+        self.stats = {reg: PollStats() for _, registers in tables for reg in registers}
+        self._plans = {}
+
+    def interval(self, reg):
+        interval = self.intervals[reg.poll_class]
+        if interval is None:
+            return None
+        if self.adaptive and self.stats[reg].interval is not None:
+            interval = self.stats[reg].interval
+        limits = self.limits.get(reg.poll_class)
+        if limits is None:
+            return interval * self.stretch
+        # Растянутый период не превышает верхнего предела класса (или заданного
+        # вручную периода, если он больше предела)
+        return min(interval * self.stretch, max(interval, limits[1]))
+
+    def is_due(self, reg, now: float):
+        # Ни разу не прочитанный регистр читается всегда, даже если он "по запросу"
+        if reg.poll_requested or reg.__value__ is None:
+            return True
+        return self.interval(reg) is not None and reg.next_poll <= now
+
+    def request(self, registers):
+        for reg in registers:
+            reg.poll_requested = True
+
+    def due_plans(self, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        result = []
+        for name, registers in self.tables:
+            due = tuple(reg for reg in registers if self.is_due(reg, now))
+            if due:
+                result.append((name, self.plan(due, registers)))
+        return result
+
+    def plan(self, due, registers):
+        plan = self._plans.get(due)
+        if plan is None:
+            if len(self._plans) >= PLAN_CACHE_SIZE:
+                self._plans.clear()
+            plan = plan_reads(list(due), self.baudrate, self.turnaround, covered=registers)
+            self._plans[due] = plan
+        return plan
+
+    def priority(self, request):
+        return min(POLL_PRIORITIES[reg.poll_class] for reg in request.registers)
+
+    def polled(self, request, now: float = None):
+        if now is None:
+            now = time.monotonic()
+        for reg in request.registers:
+            reg.poll_requested = False
+            self.track(reg, now)
+            interval = self.interval(reg)
+            reg.next_poll = now + interval if interval is not None else float('inf')
+
+    def track(self, reg, now: float):
+        stats = self.stats[reg]
+        if stats.last_poll is not None and now > stats.last_poll:
+            dt = now - stats.last_poll
+            changed = 1.0 if reg.__value__ != stats.last_value else 0.0
+            stats.change_rate += SMOOTHING * (changed / dt - stats.change_rate)
+            if stats.poll_period is None:
+                stats.poll_period = dt
+            else:
+                stats.poll_period += SMOOTHING * (dt - stats.poll_period)
+            if self.adaptive:
+                self.adapt(reg, stats)
+        stats.last_poll = now
+        stats.last_value = reg.__value__
+
+    def adapt(self, reg, stats: PollStats):
+        limits = self.limits.get(reg.poll_class)
+        if limits is None:
+            return
+        floor, ceiling = limits
+        if stats.change_rate > 0:
+            stats.interval = min(ceiling, max(floor, 1.0 / (OVERSAMPLING * stats.change_rate)))
+        else:
+            stats.interval = ceiling
+
+    # Фактическая частота опроса каждого регистра, Гц (None - ещё не опрашивался дважды)
+    def poll_rates(self):
+        return {reg.name: (1.0 / stats.poll_period if stats.poll_period else None)
+                for reg, stats in self.stats.items()}
+
+    def change_rates(self):
+        return {reg.name: stats.change_rate for reg, stats in self.stats.items()}
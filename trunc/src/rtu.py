@@ -0,0 +1,128 @@
+import struct
+import time
+import modbus_tk.defines as cst
+from modbus_tk.modbus import ModbusError, ModbusInvalidResponseError
+from pdu import build_pdu, response_length
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return tuple(table)
+
+
+CRC16_TABLE = _crc_table()
+
+BIT_READ_FUNCCODES = (cst.READ_COILS, cst.READ_DISCRETE_INPUTS)
+REGISTER_READ_FUNCCODES = (cst.READ_HOLDING_REGISTERS, cst.READ_INPUT_REGISTERS,
+                           cst.READ_WRITE_MULTIPLE_REGISTERS)
+WRITE_FUNCCODES = (cst.WRITE_SINGLE_COIL, cst.WRITE_SINGLE_REGISTER,
+                   cst.WRITE_MULTIPLE_COILS, cst.WRITE_MULTIPLE_REGISTERS)
+
+# Ответ-исключение: адрес, код функции | 0x80, код исключения, CRC
+EXCEPTION_FRAME_LENGTH = 5
+# Наибольшая длина кадра RTU
+MAX_FRAME_LENGTH = 256
+
+# Число закэшированных кадров чтения: по одному на запрос плана каждого устройства линии
+FRAME_CACHE_SIZE = 1024
+
+
+def crc16(data, crc: int = 0xffff):
+    table = CRC16_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xff]
+    return crc
+
+
+def build_frame(slave: int, pdu: bytes):
+    frame = bytes((slave,)) + pdu
+    return frame + struct.pack('<H', crc16(frame))
+
+
+_read_frames = {}
+_register_structs = {}
+
+
+# Кадр запроса чтения одинаков на каждом цикле опроса, поэтому строится один раз
+def read_frame(slave: int, funcode: int, address: int, count: int):
+    key = (slave, funcode, address, count)
+    frame = _read_frames.get(key)
+    if frame is None:
+        if len(_read_frames) >= FRAME_CACHE_SIZE:
+            _read_frames.clear()
+        frame = build_frame(slave, struct.pack('>BHH', funcode, address, count))
+        _read_frames[key] = frame
+    return frame
+
+
+def register_struct(count: int):
+    unpacker = _register_structs.get(count)
+    if unpacker is None:
+        unpacker = _register_structs[count] = struct.Struct('>%dH' % count)
+    return unpacker
+
+
+# Ожидаемая длина ответа с учётом уже принятых байт: по второму байту видно исключение
+def frame_length(received: bytes, expected_length: int):
+    if len(received) >= 2 and received[1] & 0x80:
+        return EXCEPTION_FRAME_LENGTH
+    return expected_length
+
+
+def request_frame(slave: int, funcode: int, address: int, quantity_of_x: int = 0, output_value=0,
+                  write_address: int = 0):
+    if funcode in BIT_READ_FUNCCODES or funcode in (cst.READ_HOLDING_REGISTERS, cst.READ_INPUT_REGISTERS):
+        return read_frame(slave, funcode, address, quantity_of_x)
+    return build_frame(slave, build_pdu(funcode, address, quantity_of_x, output_value, write_address))
+
+
+# Проверяет кадр ответа и возвращает данные в том же виде, что и execute() modbus_tk.
+# CRC по всему кадру вместе с контрольной суммой равна нулю, если кадр не искажён.
+def parse_frame(frame: bytes, slave: int, funcode: int, quantity_of_x: int = 0):
+    if len(frame) < EXCEPTION_FRAME_LENGTH:
+        raise ModbusInvalidResponseError('Response length is invalid %d' % len(frame))
+    if crc16(frame):
+        raise ModbusInvalidResponseError('Invalid CRC in response')
+    if frame[0] != slave:
+        raise ModbusInvalidResponseError('Response address %d is different from request address %d'
+                                         % (frame[0], slave))
+    if frame[1] == funcode | 0x80:
+        raise ModbusError(frame[2])
+    if frame[1] != funcode or len(frame) != response_length(funcode, quantity_of_x):
+        raise ModbusInvalidResponseError('Invalid response to function %d' % funcode)
+    if funcode in REGISTER_READ_FUNCCODES:
+        return register_struct(quantity_of_x).unpack_from(frame, 3)
+    if funcode in BIT_READ_FUNCCODES:
+        return tuple((frame[3 + i // 8] >> (i % 8)) & 1 for i in range(quantity_of_x))
+    return struct.unpack_from('>HH', frame, 2)
+
+
+# Быстрый путь для мастеров modbus_tk с кадрами RTU (последовательный порт и шлюз).
+# Чтение и запись FC1-6, 15, 16, 23 идут через готовые кадры и разбор struct.unpack_from,
+# всё остальное (и любые дополнительные параметры execute) - через modbus_tk.
+class FastRtuMixin:
+    fast_path = True
+    # Пауза после широковещательного запроса, пока устройства его выполняют, с
+    broadcast_turnaround = 0.1
+
+    def execute(self, slave, function_code, starting_address, quantity_of_x=0, output_value=0,
+                write_starting_address_fc23=0, **kwargs):
+        if kwargs or not self.fast_path or \
+                (function_code not in WRITE_FUNCCODES and function_code not in BIT_READ_FUNCCODES
+                 and function_code not in REGISTER_READ_FUNCCODES):
+            return super().execute(slave, function_code, starting_address, quantity_of_x, output_value,
+                                   write_starting_address_fc23=write_starting_address_fc23, **kwargs)
+        self.open()
+        self._send(request_frame(slave, function_code, starting_address, quantity_of_x, output_value,
+                                 write_starting_address_fc23))
+        if slave == 0:
+            # На широковещательный запрос ответа нет, но линия должна помолчать
+            time.sleep(self.broadcast_turnaround)
+            return ()
+        response = self._recv(response_length(function_code, quantity_of_x))
+        return parse_frame(response, slave, function_code, quantity_of_x)
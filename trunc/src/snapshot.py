@@ -0,0 +1,66 @@
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Заголовок сегмента: счётчик seqlock и число регистров
+HEADER_STRUCT = struct.Struct('<II')
+SEQUENCE_STRUCT = struct.Struct('<I')
+# Значение регистра, который ещё ни разу не прочитан из устройства
+NO_VALUE = -0x80000000
+# Сколько раз читатель повторяет чтение, пока идёт запись. Запись занимает микросекунды:
+# счётчик, который так и остался нечётным, значит, что писатель умер посреди записи.
+READ_ATTEMPTS = 1000
+
+
+# Снимок значений регистров в разделяемой памяти. Пишет один процесс (движок опроса),
+# читает любой. Счётчик seqlock нечётный, пока идёт запись; читатель повторяет чтение,
+# если счётчик был нечётным или изменился за время копирования.
+class RegisterSnapshot:
+    def __init__(self, count: int = 0, name: str = None):
+        create = name is None
+        self.memory = shared_memory.SharedMemory(name=name, create=create,
+                                                 size=HEADER_STRUCT.size + 4 * count if create else 0)
+        self.buffer = self.memory.buf
+        if create:
+            HEADER_STRUCT.pack_into(self.buffer, 0, 0, count)
+        self.count = HEADER_STRUCT.unpack_from(self.buffer, 0)[1]
+        self.values = struct.Struct('<%di' % self.count)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    @property
+    def sequence(self):
+        return SEQUENCE_STRUCT.unpack_from(self.buffer, 0)[0]
+
+    def publish(self, values):
+        sequence = self.sequence
+        if sequence & 1:
+            # Прежний писатель (упавший процесс линии) не закончил запись: счётчик
+            # возвращается к чётному, иначе читатели видели бы запись всегда незаконченной
+            sequence += 1
+        SEQUENCE_STRUCT.pack_into(self.buffer, 0, (sequence + 1) & 0xffffffff)
+        self.values.pack_into(self.buffer, HEADER_STRUCT.size,
+                              *[NO_VALUE if value is None else value for value in values])
+        SEQUENCE_STRUCT.pack_into(self.buffer, 0, (sequence + 2) & 0xffffffff)
+
+    # Возвращает счётчик и согласованный набор значений (None - значения ещё нет)
+    # или None, если согласованный набор прочитать не удалось
+    def read(self, attempts: int = READ_ATTEMPTS):
+        for _ in range(attempts):
+            sequence = self.sequence
+            if sequence & 1:
+                time.sleep(0)
+                continue
+            values = self.values.unpack_from(self.buffer, HEADER_STRUCT.size)
+            if self.sequence == sequence:
+                return sequence, [None if value == NO_VALUE else value for value in values]
+        return None
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+
+    def unlink(self):
+        self.memory.unlink()
@@ -1,17 +1,36 @@
 import modbus_tk.defines as cst
-from modbus_tk import modbus_rtu
 from modbus_tk.modbus import ModbusInvalidResponseError
 from PyQt5.QtCore import pyqtSignal, QObject
-from threading import Thread, Event
+from threading import Thread, Event, Lock
+from concurrent.futures import Future
 from modbus_tk import modbus
-from serial import Serial
 from datetime import datetime
+from modbus_io import make_worker, PRIORITY_WRITE, PRIORITY_ALARM, PRIORITY_POLL, PRIORITY_CONFIG
+from planner import plan_reads, plan_writes, ReadRequest, WRITE_FUNCCODES, MAX_WRITE_COUNT
+from transport import open_master, is_network
+from polling import PollScheduler, POLL_INTERVALS, MAX_STRETCH, POLL_FAST, POLL_NORMAL, POLL_SLOW, POLL_ON_DEMAND
+from timing import Deadline, Histogram, TICK_COALESCE
+from timeouts import ResponseTimeouts, MIN_RESPONSE_TIMEOUT, MAX_RESPONSE_TIMEOUT
+from health import DeviceHealth, DEVICE_HEALTHY, DEVICE_OFFLINE, NO_RESPONSE_ERRORS
+from connection import port_watcher
+from fairness import FairScheduler
+import time
+import os
+# Окно, за которое правки регистров собираются в одну запись, с
+COMMIT_DELAY = 0.03
+# Пауза перед повтором записи, на которую устройство не ответило, с: удваивается
+# после каждой неудачи до MAX_COMMIT_RETRY_DELAY
+COMMIT_RETRY_DELAY = 0.5
+MAX_COMMIT_RETRY_DELAY = 30
+
 
 class Communicate(QObject):
     RegistersUpdated = pyqtSignal()
     RegistersCommited = pyqtSignal()
     ErrorReadingRegister = pyqtSignal(str)
     ErrorCommitingRegister = pyqtSignal(str)
+    # Новое состояние связи с устройством: healthy, suspect или offline
+    HealthChanged = pyqtSignal(str)
 
 
 def get_modbus_funccode(reg_type: int, action: str = 'read'):
@@ -25,15 +44,25 @@ def get_modbus_funccode(reg_type: int, action: str = 'read'):
 
 
 class Register:
-    def __init__(self, device, name: str, regtype: int, address: int):
+    def __init__(self, device, name: str, regtype: int, address: int, poll_class: str = POLL_NORMAL):
         self.name = name
         self.reg_type = regtype
         self.address = address
         self.device = device
+        self.poll_class = poll_class
+        # Время (time.monotonic), когда регистр пора прочитать снова
+        self.next_poll = 0
+        self.poll_requested = False
         # Текущее значение региста. Показывает текущее состояние регистра устройства.
         self.__value__ = None
+        # Время (time.monotonic), когда значение получено из устройства или подтверждено записью
+        self.timestamp = None
         # Это значение было записано в регистр, и может быть отправлено в устройство с помощью метода commit()
         self.__commit_buffer__ = None
+        # Номер правки буфера: по нему видно, что регистр изменили, пока шла его запись
+        self.generation = 0
+        # Ожидающие записи правок (см. wait_written): список (номер правки, Future)
+        self.__waiters__ = []
 
     def __get_value__(self):
         if self.__commit_buffer__ is None:
@@ -46,26 +75,92 @@ class Register:
             return self.__commit_buffer__
 
     def __set_value__(self, value: int):
+        # В устройство уходит целое: буфер хранит то же значение, что потом подтвердит written()
+        value = int(value)
         if self.__commit_buffer__ != value:
             self.__commit_buffer__ = value
+            self.generation += 1
+            self.device.register_modified(self)
 
-    def __internal_commit__(self):
-        try:
-            funcode = get_modbus_funccode(self.reg_type, 'write')
-        except IndexError:
-            raise Exception('This register for read only')
+    # Возраст значения, с (None - значения ещё нет)
+    def age(self, now: float = None):
+        if self.timestamp is None:
+            return None
+        return (time.monotonic() if now is None else now) - self.timestamp
+
+    # max_age=None - подходит любое полученное значение
+    def is_fresh(self, now: float, max_age: float = None):
+        return self.timestamp is not None and (max_age is None or now - self.timestamp <= max_age)
+
+    # Future, который завершится, когда текущая правка уйдёт в устройство: результатом -
+    # записанным значением, или исключением, с которым запись не прошла. Правку, которую
+    # успели заменить новой, завершает запись новой.
+    def wait_written(self):
+        future = Future()
+        if self.__commit_buffer__ is None:
+            future.set_result(self.__value__)
+        else:
+            self.__waiters__.append((self.generation, future))
+        return future
+
+    # generation - номер правки, с которой была спланирована запись (None - текущий)
+    def __resolve__(self, generation, value=None, error=None):
+        if generation is None:
+            generation = self.generation
+        done = [(number, future) for number, future in self.__waiters__ if number <= generation]
+        for waiter in done:
+            self.__waiters__.remove(waiter)
+            if error is not None:
+                waiter[1].set_exception(error)
+            else:
+                waiter[1].set_result(value)
+
+    def written(self, value, generation=None):
+        # Буфер сбрасывается, только если за время записи в него не положили новое значение
+        self.__value__ = value
+        self.timestamp = time.monotonic()
+        if self.__commit_buffer__ == value:
+            self.__commit_buffer__ = None
+        # Записанное значение перечитывается на ближайшем цикле независимо от класса опроса
+        self.poll_requested = True
+        self.__resolve__(generation, value)
+
+    # Запись не прошла. Отказ устройства (ответ-исключение) отменяет правку; если устройство
+    # не ответило, правка остаётся в буфере и уйдёт при следующей попытке
+    def write_failed(self, value, error, generation=None):
+        if isinstance(error, modbus.ModbusError) and self.__commit_buffer__ == value:
+            self.__commit_buffer__ = None
+        self.poll_requested = True
+        self.__resolve__(generation, error=error)
+
+    def __commit_done__(self, future, value, generation):
+        if future.cancelled():
+            return
         try:
-            self.device.rtu_master.execute(1, funcode, self.address, output_value=[int(self.__commit_buffer__)])
+            future.result()
         except ModbusInvalidResponseError as e:
             self.device.communicate.ErrorCommitingRegister.emit('Error while writing %s' % self.name)
+            self.write_failed(value, e, generation)
+            return
         except modbus.struct.error as ste:
             pass
-        self.__value__ = self.__commit_buffer__
-        self.__commit_buffer__ = None
+        except Exception as e:
+            self.device.communicate.ErrorCommitingRegister.emit(str(e))
+            self.write_failed(value, e, generation)
+            return
+        self.written(value, generation)
 
     def commit(self):
-        writer = Thread(target=self.__internal_commit__)
-        writer.start()
+        try:
+            funcode = get_modbus_funccode(self.reg_type, 'write')
+        except IndexError:
+            raise Exception('This register for read only')
+        value = self.__commit_buffer__
+        generation = self.generation
+        # Запись выполняет поток порта, отдельный поток на каждую запись больше не нужен
+        future = self.device.submit(PRIORITY_WRITE, self.device.slave, funcode, self.address, output_value=[int(value)])
+        future.add_done_callback(lambda f: self.__commit_done__(f, value, generation))
+        return future
 
     def __get_modified__(self):
         return not self.__commit_buffer__ is None
@@ -79,129 +174,630 @@ class Register:
     modified = property(__get_modified__)
 
 
-class SunlineDevice:
-    discrete_input_list = []
-    coil_list = []
-    input_register_list = []
-    holding_register_list = []
+# Цикл запускается по сетке абсолютных сроков (см. timing.Deadline),
+# поэтому время обмена и таймауты не сдвигают период опроса
+class StopableThread(Thread):
+    def __init__(self, proc, interval, schedule=None):
+        Thread.__init__(self)
+        self.schedule = schedule if schedule is not None else Deadline(interval)
+        self.schedule.interval = interval
+        self._stopevent = Event()
+        self.proc = proc
+
+    @property
+    def interval(self):
+        return self.schedule.interval
+
+    @interval.setter
+    def interval(self, value):
+        self.schedule.interval = value
+
+    def run(self):
+        self._stopevent.clear()
+        self.schedule.start(time.monotonic())
+        while not self._stopevent.wait(self.schedule.delay(time.monotonic())):
+            started = self.schedule.begin(time.monotonic())
+            self.proc()
+            self.schedule.end(started, time.monotonic())
+
+    def stop(self):
+        self._stopevent.set()
+
+
+# Запись по событию: изменённый регистр будит поток, который выжидает coalesce секунд,
+# чтобы пачка правок ушла одним кадром, и записывает все изменённые устройства.
+# Пока изменений нет, поток спит на событии и не просыпается вовсе.
+class CommitThread(Thread):
+    def __init__(self, proc, coalesce: float, latency=None):
+        Thread.__init__(self)
+        self.proc = proc
+        self.coalesce = coalesce
+        # Время от первого изменения до окончания записи, с
+        self.latency = latency if latency is not None else Histogram()
+        self._pending = {}
+        self._lock = Lock()
+        self._wakeup = Event()
+        self._stopevent = Event()
 
-    class StopableThread(Thread):
-        def __init__(self, proc, interval):
-            Thread.__init__(self)
-            self.interval = interval
-            self._stopevent = Event()
-            self.proc = proc
-        def run(self):
-            self._stopevent.clear()
-            while not self._stopevent.isSet():
-                self.proc()
-                self._stopevent.wait(self.interval)
-        def stop(self):
-            self._stopevent.set()
-
-    def __init__(self, port, baudrate, autoupdate, autocommit, update_interval, commit_interval):
+    # delay - через сколько записать устройство (по умолчанию coalesce); более ранний
+    # срок из уже назначенных сохраняется
+    def notify(self, device, delay: float = None):
+        now = time.monotonic()
+        due = now + (self.coalesce if delay is None else delay)
+        with self._lock:
+            modified, pending_due = self._pending.get(device, (now, due))
+            self._pending[device] = (modified, min(due, pending_due))
+        self._wakeup.set()
+
+    def run(self):
+        while not self._stopevent.is_set():
+            with self._lock:
+                self._wakeup.clear()
+                now = time.monotonic()
+                ready = {device: modified for device, (modified, due) in self._pending.items() if due <= now}
+                for device in ready:
+                    del self._pending[device]
+                next_due = min((due for _, due in self._pending.values()), default=None)
+            if ready:
+                self.proc(list(ready))
+                now = time.monotonic()
+                for modified in ready.values():
+                    self.latency.add(now - modified)
+                continue
+            self._wakeup.wait(None if next_due is None else next_due - now)
+
+    def stop(self):
+        self._stopevent.set()
+        self._wakeup.set()
+
+
+# Линия RS-485: один порт, один поток ввода-вывода и общий цикл опроса
+# для всех устройств, подключенных к линии (каждое со своим адресом).
+class SunlineBus:
+    def __init__(self, port, baudrate, autoupdate=True, autocommit=True, update_interval=0.1, commit_interval=1,
+                 adaptive=False, bus_budget=0.8, missed_ticks=TICK_COALESCE,
+                 min_timeout=MIN_RESPONSE_TIMEOUT, max_timeout=MAX_RESPONSE_TIMEOUT, watch_ports=True,
+                 commit_delay=COMMIT_DELAY):
+        self.port = port
+        # Для сетевых транспортов скорость линии за шлюзом нужна только планировщику и таймаутам
+        self.timeouts = ResponseTimeouts(int(baudrate) if baudrate else 19200, min_timeout, max_timeout)
         self.update_interval = update_interval
         self.commit_interval = commit_interval
+        # Окно, за которое правки собираются в одну запись, с; None - запись по таймеру
+        # раз в commit_interval, как раньше
+        self.commit_delay = commit_delay
+        self.commit_latency = Histogram()
         self.autoupdate = autoupdate
         self.autocommit = autocommit
+        # Адаптивный опрос: доля времени линии, которую разрешено занимать опросом
+        self.adaptive = adaptive
+        self.bus_budget = bus_budget
+        self.bus_load = 0.0
+        self.stretch = 1.0
+        self._load_sample = None
+        # Сроки циклов опроса и записи; статистика сохраняется между stop() и start()
+        self.update_schedule = Deadline(update_interval, missed_ticks)
+        self.commit_schedule = Deadline(commit_interval, missed_ticks)
 
-        self.rtu_master = modbus_rtu.RtuMaster(Serial(port=port, baudrate=baudrate, \
-                                                      bytesize=8, parity='N', stopbits=1, xonxoff=0))
-        self.rtu_master.set_timeout(3)
+        self.rtu_master = open_master(port, self.baudrate, timeout=max_timeout)
+        self.io_worker = None
+        self.updater = None
+        self.commiter = None
+        # Последовательный порт отслеживается: при отключении адаптера опрос
+        # приостанавливается, при появлении порт сразу переоткрывается
+        self.watcher = port_watcher() if watch_ports and not is_network(port) else None
+        # Распределение времени линии по весам и срокам устаревания устройств
+        self.fair = FairScheduler()
+        self.cycle_time = 0.0
+        self.connected = True
+        # Порт, которого нет в списке системы (виртуальный, pty), не отслеживается
+        self._port_present = None
+        self._port_identity = None
+        self._port_call = None
 
-        self.discrete_regs = [Register(*reg) for reg in self.discrete_input_list]
-        self.coil_regs = [Register(*reg) for reg in self.coil_list]
-        self.input_regs = [Register(*reg) for reg in self.input_register_list]
-        self.holding_regs = [Register(*reg) for reg in self.holding_register_list]
+        self.devices = []
 
-        self.regs = self.discrete_regs + self.coil_regs + self.input_regs + self.holding_regs
+    # Таймаут ответа считается от скорости линии, поэтому меняется вместе с ней
+    @property
+    def baudrate(self):
+        return self.timeouts.baudrate
 
-        self.communicate = Communicate()
+    @baudrate.setter
+    def baudrate(self, value):
+        self.timeouts.baudrate = value
 
-        self.start()
+    def add_device(self, device):
+        device.bus = self
+        if device not in self.devices:
+            self.devices.append(device)
+        device.build_read_plan()
 
-    def commit_coils(self): raise NotImplementedError
+    def remove_device(self, device):
+        if device in self.devices:
+            self.devices.remove(device)
+        self.fair.forget(device)
 
-    def commit_holding(self): raise NotImplementedError
+    def find_device(self, slave: int):
+        for device in self.devices:
+            if device.slave == slave:
+                return device
+        return None
 
-    def commit_registers(self):
-        if not self.commit_coils():
-            self.commit_holding()
+    def build_read_plans(self):
+        for device in self.devices:
+            device.build_read_plan()
 
-        self.communicate.RegistersCommited.emit()
+    def submit(self, priority, *args, **kwargs):
+        return self.io_worker.submit(priority, *args, **kwargs)
 
-        #print(datetime.now(), ' commited!')
+    def execute(self, *args, priority=PRIORITY_POLL, **kwargs):
+        return self.io_worker.execute(*args, priority=priority, **kwargs)
 
-    def internal_update_discrete_inputs(self): raise NotImplementedError
+    def update_devices(self):
+        if self.io_worker.connected != self.connected:
+            self.connection_changed(self.io_worker.connected)
+        if not self.connected and self._port_present is False:
+            # Порт переоткроет наблюдатель за портами, когда он снова появится в системе.
+            # Порт, которого нет в списке системы, переоткрывает сам поток порта с паузой.
+            return
+        if self.adaptive:
+            self.adjust_stretch()
+        now = time.monotonic()
+        plans = [(device, device.due_reads(now)) for device in list(self.devices)]
+        costs = [(device, device.read_cost(due)) for device, due in plans if due]
+        # Когда план цикла не помещается в период, часть устройств ждёт следующего цикла
+        devices = self.fair.select(costs, now, self.update_interval, max(self.update_interval, self.cycle_time))
+        due = dict(plans)
+        submitted = [device.submit_plans(due[device]) for device in devices]
+        for device, reads in zip(devices, submitted):
+            if device.apply_reads(reads):
+                self.fair.updated(device, time.monotonic())
+            device.communicate.RegistersUpdated.emit()
+        self.cycle_time = time.monotonic() - now
 
-    def internal_update_coil_data(self): raise NotImplementedError
+        if not self.commiter._started.is_set() and self.autocommit:
+            self.commiter.start()
 
-    def internal_update_analog_data(self): raise NotImplementedError
+    # Раз в секунду сравнивает загрузку линии с бюджетом и растягивает
+    # или сжимает периоды опроса всех устройств одним множителем
+    def adjust_stretch(self, period=1.0):
+        now = time.monotonic()
+        busy = self.io_worker.busy_time
+        if self._load_sample is None:
+            self._load_sample = (now, busy)
+            return
+        started, started_busy = self._load_sample
+        if now - started < period:
+            return
+        self.bus_load = (busy - started_busy) / (now - started)
+        self._load_sample = (now, busy)
+        if self.bus_load > self.bus_budget:
+            self.stretch = min(MAX_STRETCH, self.stretch * self.bus_load / self.bus_budget)
+        elif self.bus_load < 0.8 * self.bus_budget:
+            self.stretch = max(1.0, self.stretch * 0.9)
+        for device in self.devices:
+            device.poller.stretch = self.stretch
 
-    def internal_update_holding_data(self): raise NotImplementedError
+    # Достигнутая частота обновления и устаревание данных каждого устройства:
+    # {адрес: {'rate', 'staleness', 'max_seen_staleness', 'violations', ...}}
+    def service_levels(self):
+        return self.fair.statistics(time.monotonic())
 
-    def update_discrete_inputs(self):
-        try:
-            self.internal_update_discrete_inputs()
-        except modbus_rtu.ModbusInvalidResponseError as e:
-            self.communicate.ErrorReadingRegister.emit('Error while getting discrete')
-        except Exception as e:
-            self.communicate.ErrorReadingRegister.emit(str(e))
+    # Гистограммы опоздания и длительности циклов: растущий хвост опозданий
+    # и пропуски тактов означают, что линия не успевает за заданным периодом
+    def cycle_statistics(self):
+        return {'update': self.update_schedule.statistics(),
+                'commit': self.commit_schedule.statistics(),
+                'commit_latency': self.commit_latency}
 
-    def update_coil_data(self):
-        try:
-            self.internal_update_coil_data()
-        except modbus_rtu.ModbusInvalidResponseError as e:
-            self.communicate.ErrorReadingRegister.emit('Error while getting coil')
-        except Exception as e:
-            self.communicate.ErrorReadingRegister.emit(str(e))
+    def commit_devices(self):
+        for device in list(self.devices):
+            device.commit_registers()
 
-    def update_analog_data(self):
-        try:
-            self.internal_update_analog_data()
-        except modbus_rtu.ModbusInvalidResponseError as e:
-            self.communicate.ErrorReadingRegister.emit('Error while getting analog')
-        except Exception as e:
-            self.communicate.ErrorReadingRegister.emit(str(e))
+    def commit_changes(self, devices):
+        for device in devices:
+            device.commit_registers()
+            # Отключённое устройство запишется, когда снова выйдет на связь
+            if device.health.offline or not device.modified:
+                continue
+            # Правка, сделанная во время записи, уходит сразу, а запись без ответа
+            # повторяется после паузы, чтобы не занимать общую линию
+            self.schedule_commit(device, None if device.edited_in_flight else device.commit_backoff)
 
-    def update_holding_data(self):
-        try:
-            self.internal_update_holding_data()
-        except modbus_rtu.ModbusInvalidResponseError as e:
-            self.communicate.ErrorReadingRegister.emit('Error while getting holding')
-        except Exception as e:
-            self.communicate.ErrorReadingRegister.emit(str(e))
+    def schedule_commit(self, device, delay: float = None):
+        commiter = self.commiter
+        if self.autocommit and isinstance(commiter, CommitThread):
+            commiter.notify(device, delay)
 
-    def update_registers(self):
-        self.update_discrete_inputs()
-        self.update_coil_data()
-        self.update_analog_data()
-        self.update_holding_data()
+    # Записывает одинаковые значения во все устройства линии одним широковещательным
+    # кадром FC15/FC16 на каждый непрерывный диапазон адресов (адрес устройства 0).
+    # С verify=True затем все устройства разом перечитывают записанные регистры;
+    # возвращается {адрес устройства: {регистр: прочитанное значение}} для расхождений
+    # (None - устройство не ответило или отключено).
+    def broadcast(self, values: dict, verify: bool = True):
+        registers = {}
+        for name in values:
+            reg = next((device[name] for device in self.devices if device[name] is not None), None)
+            if reg is None:
+                raise Exception('Unknown register %s' % name)
+            if reg.reg_type not in WRITE_FUNCCODES:
+                raise Exception('This register for read only')
+            if name == reg.device.slave_register:
+                raise Exception('Register %s cannot be broadcast' % name)
+            registers[name] = reg
 
-        self.communicate.RegistersUpdated.emit()
+        for reg_type in (cst.COILS, cst.HOLDING_REGISTERS):
+            table = sorted([reg for reg in registers.values() if reg.reg_type == reg_type],
+                           key=lambda reg: reg.address)
+            funcode = WRITE_FUNCCODES[reg_type][1]
+            while table:
+                run = [table.pop(0)]
+                while table and table[0].address == run[-1].address + 1 and len(run) < MAX_WRITE_COUNT[reg_type]:
+                    run.append(table.pop(0))
+                self.execute(0, funcode, run[0].address, output_value=[int(values[reg.name]) for reg in run],
+                             priority=PRIORITY_WRITE)
 
-        #print(datetime.now(), 'updated!')
+        devices = list(self.devices)
+        for device in devices:
+            for name, value in values.items():
+                if device[name] is not None:
+                    device[name].written(int(value))
+        if not verify:
+            return None
 
-        if not self.commiter._started.is_set() and self.autocommit:
-            self.commiter.start()
+        submitted = [device.submit_registers([device[name] for name in values if device[name] is not None])
+                     if not device.health.offline else None for device in devices]
+        mismatches = {}
+        for device, reads in zip(devices, submitted):
+            if reads is not None:
+                device.apply_reads(reads)
+            for name, value in values.items():
+                reg = device[name]
+                if reg is None:
+                    continue
+                if reads is None or reg.poll_requested:
+                    mismatches.setdefault(device.slave, {})[name] = None
+                elif reg.__value__ != int(value):
+                    mismatches.setdefault(device.slave, {})[name] = reg.__value__
+        return mismatches
 
-    def reset_modified(self):
-        for reg in self.regs:
-            reg.__commit_buffer__ = None
+    # Переоткрывает последовательный порт под другим именем и (или) меняет его скорость.
+    # Порт перенастраивается в потоке порта между транзакциями; сетевой шлюз
+    # настраивается отдельно.
+    def reconfigure(self, port: str = None, baudrate: int = None):
+        if is_network(self.port):
+            raise Exception('Port %s is set on the gateway' % self.port)
+        serial = self.rtu_master._serial
+        worker = self.io_worker
+
+        def reopen():
+            if port is not None and port != serial.port:
+                worker.connection_lost()
+                serial.port = port
+            if baudrate is not None:
+                serial.baudrate = baudrate
+            if not worker.connected:
+                worker.reconnect()
+
+        worker.call(reopen).result()
+        if port is not None:
+            self.port = port
+            self._port_identity = None
+        if baudrate is not None:
+            self.baudrate = int(baudrate)
+            self.build_read_plans()
+
+    def set_baudrate(self, baudrate: int):
+        self.reconfigure(baudrate=baudrate)
+
+    # Вызывается наблюдателем за портами со списком портов {имя: признак адаптера}
+    def check_port(self, ports: dict):
+        worker = self.io_worker
+        if worker is None or (self._port_call is not None and not self._port_call.done()):
+            return
+        serial = self.rtu_master._serial
+        name = serial.port
+        # Ссылки вида /dev/serial/by-id/... указывают на порт из списка
+        key = name if name in ports else os.path.realpath(name)
+        present = key in ports
+        if self._port_present is None and not present:
+            return
+        arrived = present and not self._port_present
+        self._port_present = present
+        if present and ports[key] is not None:
+            self._port_identity = ports[key]
+        if worker.connected:
+            if not present:
+                # Адаптер выдернут: порт закрывается сразу, не дожидаясь ошибок обмена
+                self._port_call = worker.call(worker.connection_lost)
+            return
+        if not present:
+            renamed = [other for other, identity in ports.items()
+                       if identity is not None and identity == self._port_identity]
+            if not renamed:
+                return
+            name = renamed[0]
+            arrived = True
+
+        def reopen():
+            if name != serial.port:
+                serial.port = name
+            if arrived:
+                worker.reconnect()
+            else:
+                worker.ensure_connected()
+
+        self._port_call = worker.call(reopen)
+        if not present:
+            self.port = name
+
+    # Потеря порта переводит все устройства в offline сразу; после восстановления
+    # каждое устройство проверяется первым же циклом и перечитывается целиком
+    def connection_changed(self, connected: bool):
+        self.connected = connected
+        if not connected:
+            for device in list(self.devices):
+                device.health_changed(device.health.disconnected())
+
+    # Останавливает циклы опроса и записи, не закрывая порт: транзакции через
+    # execute() продолжают выполняться. Нельзя вызывать из самих циклов.
+    def pause(self):
+        for thread in (self.updater, self.commiter):
+            thread.stop()
+            if thread.is_alive():
+                thread.join()
+
+    def resume(self):
+        self.updater = StopableThread(self.update_devices, self.update_interval, self.update_schedule)
+        if self.commit_delay is None:
+            self.commiter = StopableThread(self.commit_devices, self.commit_interval, self.commit_schedule)
+        else:
+            self.commiter = CommitThread(self.commit_changes, self.commit_delay, self.commit_latency)
+            for device in self.devices:
+                if device.modified:
+                    self.schedule_commit(device)
+        if self.autoupdate:
+            self.updater.start()
 
     def stop(self):
-        self.rtu_master.close()
+        if self.watcher is not None:
+            self.watcher.detach(self)
         self.commiter.stop()
         self.updater.stop()
+        self.io_worker.stop()
+        self.io_worker.join()
+        self.rtu_master.close()
 
     def start(self):
-        #if self.rtu_master._is_opened():
-        #    raise Exception
-        self.rtu_master.open()
-        self.updater = self.StopableThread(self.update_registers, self.update_interval)
-        self.commiter = self.StopableThread(self.commit_registers, self.commit_interval)
-        if self.autoupdate:
-            self.updater.start()
+        self.io_worker = make_worker(self.rtu_master, self.timeouts)
+        try:
+            self.rtu_master.open()
+        except OSError:
+            # Недоступный шлюз не мешает запуску: поток порта переподключится сам
+            if not is_network(self.port):
+                raise
+            self.io_worker.connection_lost()
+        self.io_worker.start()
+        self.connected = self.io_worker.connected
+        if self.watcher is not None:
+            self.watcher.attach(self)
+        self.resume()
+
+
+# Карта регистров и логика устройства, общая для потокового (SunlineDevice) и асинхронного
+# (aiosunline.AsyncSunlineDevice) движков. Движки различаются только тем, как запросы
+# уходят в линию и как дожидаются ответа.
+class SunlineDeviceBase:
+    discrete_input_list = []
+    coil_list = []
+    input_register_list = []
+    holding_register_list = []
+    # Регистр, в котором хранится адрес устройства на линии
+    slave_register = None
+
+    def init_registers(self, slave):
+        self.slave = slave
+        self.poll_intervals = dict(POLL_INTERVALS)
+        # Максимальный разрыв (в адресах) между изменёнными регистрами, который
+        # допускается перезаписать текущими значениями ради одного кадра вместо двух
+        self.write_gap_merge = 0
+        # Итог последней записи по группам регистров (см. commit_finished)
+        self.last_commit = None
+        # Регистры изменили, пока шла запись; пауза перед повтором записи без ответа
+        self.edited_in_flight = False
+        self.commit_backoff = 0
+
+        self.discrete_regs = [Register(self, *reg) for reg in self.discrete_input_list]
+        self.coil_regs = [Register(self, *reg) for reg in self.coil_list]
+        self.input_regs = [Register(self, *reg) for reg in self.input_register_list]
+        self.holding_regs = [Register(self, *reg) for reg in self.holding_register_list]
+
+        self.regs = self.discrete_regs + self.coil_regs + self.input_regs + self.holding_regs
+
+        self.communicate = Communicate()
+        self.health = DeviceHealth()
+
+    @property
+    def baudrate(self):
+        return self.bus.baudrate
+
+    def submit(self, priority, *args, **kwargs):
+        return self.bus.submit(priority, *args, **kwargs)
+
+    # Все изменённые регистры записываются за один проход: сначала coils (защитные
+    # выходы), затем holding, внутри таблицы по возрастанию адреса. Запись адреса
+    # устройства идёт последней: после неё устройство отвечает уже по новому адресу.
+    def plan_commit(self):
+        batch = [('coil', request) for request in plan_writes(self.coil_regs, self.write_gap_merge)] + \
+                [('holding', request) for request in plan_writes(self.holding_regs, self.write_gap_merge)]
+        batch.sort(key=lambda item: any(reg.name == self.slave_register for reg in item[1].registers))
+        return batch
+
+    # Поколения буферов записи до начала записи: по ним видно, правили ли регистры, пока она шла
+    def commit_started(self):
+        results = {'coil': {'written': [], 'failed': []},
+                   'holding': {'written': [], 'failed': []}}
+        return results, [(reg, reg.generation) for reg in self.coil_regs + self.holding_regs]
+
+    # read - запрос чтения, совмещённый с записью в кадре FC23, и его данные data
+    def apply_write(self, request, read, data, error, result):
+        if error is not None:
+            result['failed'].extend(reg.name for reg in request.registers)
+            for reg, value, generation in zip(request.registers, request.values, request.generations):
+                reg.write_failed(value, error, generation)
+            return
+        result['written'].extend(reg.name for reg in request.registers)
+        for reg, value, generation in zip(request.registers, request.values, request.generations):
+            # После записи нового адреса устройство отвечает уже по нему
+            if reg.name == self.slave_register:
+                self.slave = value
+            reg.written(value, generation)
+        if read is not None:
+            # Ответ FC23 заменяет отдельное чтение таблицы. Некоторые прошивки читают
+            # до записи, поэтому для записанных регистров остаются записанные значения.
+            now = time.monotonic()
+            for reg in read.registers:
+                if reg not in request.registers:
+                    reg.__value__ = data[reg.address - read.address]
+                    reg.timestamp = now
+            self.poller.polled(read, now)
+
+    # Возвращает итог по группам: {'coil': {'written': [...], 'failed': [...]}, 'holding': {...}}
+    def commit_finished(self, results, generations):
+        self.edited_in_flight = any(reg.generation != generation for reg, generation in generations)
+        if any(result['failed'] for result in results.values()):
+            self.commit_backoff = min(MAX_COMMIT_RETRY_DELAY, max(COMMIT_RETRY_DELAY, 2 * self.commit_backoff))
+        else:
+            self.commit_backoff = 0
+        for name, result in results.items():
+            if result['failed']:
+                self.communicate.ErrorCommitingRegister.emit(
+                    'Error while commiting %s register(s): %s' % (name, ', '.join(result['failed'])))
+        self.last_commit = results
+        return results
+
+    @property
+    def modified(self):
+        return any(reg.modified for reg in self.coil_regs + self.holding_regs)
+
+    # Ожидающие записи узнают, что устройство отключено; сама правка остаётся в буфере
+    def offline_writes(self):
+        error = ConnectionError('Device %d is offline' % self.slave)
+        for reg in self.coil_regs + self.holding_regs:
+            if reg.modified:
+                reg.write_failed(reg.__commit_buffer__, error)
+
+    def register_modified(self, reg):
+        self.bus.schedule_commit(self)
+
+    def build_read_plan(self, turnaround=0.005):
+        # План чтения зависит от скорости порта, поэтому перестраивается при её смене
+        self.discrete_plan = plan_reads(self.discrete_regs, self.baudrate, turnaround)
+        self.coil_plan = plan_reads(self.coil_regs, self.baudrate, turnaround)
+        self.input_plan = plan_reads(self.input_regs, self.baudrate, turnaround)
+        self.holding_plan = plan_reads(self.holding_regs, self.baudrate, turnaround)
+        self.poller = PollScheduler([('discrete', self.discrete_regs), ('coil', self.coil_regs),
+                                     ('analog', self.input_regs), ('holding', self.holding_regs)],
+                                    self.baudrate, self.poll_intervals, turnaround, self.bus.adaptive)
+        self.poller.stretch = self.bus.stretch
+        # Проверка связи с отключённым устройством: один элемент первой таблицы карты
+        first = self.regs[0]
+        self.probe_request = ReadRequest(first.reg_type, first.address, 1, [first])
+
+    def poll_rates(self):
+        return self.poller.poll_rates()
+
+    def change_rates(self):
+        return self.poller.change_rates()
+
+    def read_tables(self):
+        return [('discrete', self.discrete_plan, PRIORITY_ALARM),
+                ('coil', self.coil_plan, PRIORITY_POLL),
+                ('analog', self.input_plan, PRIORITY_ALARM),
+                ('holding', self.holding_plan, PRIORITY_CONFIG)]
+
+    # Планы чтения только тех регистров, которым подошёл срок по их классу опроса
+    def due_reads(self, now=None):
+        if now is None:
+            now = time.monotonic()
+        if self.health.offline:
+            # Отключённое устройство не занимает линию, пока не подойдёт срок проверки
+            if not self.health.probe_due(now):
+                return []
+            return [('probe', [self.probe_request])]
+        return self.poller.due_plans(now)
+
+    def read_priority(self, name, request):
+        return PRIORITY_CONFIG if name == 'probe' else self.poller.priority(request)
+
+    # Ожидаемое время линии на выполнение планов чтения, с
+    def read_cost(self, plans):
+        timeouts = self.bus.timeouts
+        return sum(timeouts.expected(self.slave, request.funcode, request.count)
+                   for _, plan in plans for request in plan)
+
+    def read_done(self, request, data):
+        now = time.monotonic()
+        for reg in request.registers:
+            reg.__value__ = data[reg.address - request.address]
+            reg.timestamp = now
+        self.poller.polled(request, now)
+
+    # outcomes - [(таблица, None или исключение), ...] по каждому запросу чтения.
+    # Возвращает, ответило ли устройство хотя бы на один запрос.
+    def reads_finished(self, outcomes):
+        # Пока связь под подозрением, ошибки каждого цикла в журнал не пишутся:
+        # о потере связи сообщает сигнал HealthChanged
+        report = self.health.state == DEVICE_HEALTHY
+        answered = silent = False
+        for name, error in outcomes:
+            if error is None:
+                answered = True
+            elif isinstance(error, NO_RESPONSE_ERRORS):
+                silent = True
+                if report:
+                    self.communicate.ErrorReadingRegister.emit('Error while getting %s' % name)
+            else:
+                # Ответ-исключение Modbus означает, что устройство на связи
+                answered = answered or isinstance(error, modbus.ModbusError)
+                self.communicate.ErrorReadingRegister.emit(str(error))
+        if answered:
+            self.health_changed(self.health.succeeded())
+        elif silent:
+            self.health_changed(self.health.failed(time.monotonic()))
+        return answered
+
+    def health_changed(self, state):
+        if state is None:
+            return
+        self.bus.timeouts.probe(self.slave, state == DEVICE_OFFLINE)
+        if state == DEVICE_HEALTHY:
+            # Пока устройство молчало, значения устарели: перечитываем всю карту
+            self.poller.request(self.regs)
+            if self.modified:
+                self.bus.schedule_commit(self)
+        self.communicate.HealthChanged.emit(state)
+
+    def request_read(self, names):
+        self.poller.request([reg for reg in self.regs if reg.name in names])
+
+    # Регистры по именам для read()
+    def registers(self, names):
+        regs = [self[name] for name in names]
+        if None in regs:
+            raise Exception('Unknown register %s' % names[regs.index(None)])
+        return regs
+
+    # Значения, полученные не раньше max_age секунд до now; иначе исключение
+    def fresh_values(self, regs, now, max_age):
+        stale = [reg.name for reg in regs if not reg.is_fresh(now, max_age)]
+        if stale:
+            raise Exception('Registers %s were not read' % ', '.join(stale))
+        return {reg.name: reg.__value__ for reg in regs}
+
+    def reset_modified(self):
+        for reg in self.regs:
+            reg.__commit_buffer__ = None
 
     def __getitem__(self, name: str):
         for reg in self.regs:
@@ -210,112 +806,238 @@ class SunlineDevice:
         return None
 
 
-class AutoTransformer(SunlineDevice):
-    def __init__(self, port, baudrate, autoupdate, autocommit, update_interval=0.1, commit_interval=1):
-        self.discrete_input_list = [
-            (self, 'Alarm', cst.DISCRETE_INPUTS, 0),
-            (self, 'Initial_JP', cst.DISCRETE_INPUTS, 1),
-            (self, 'Press_rel', cst.DISCRETE_INPUTS, 2),
-            (self, 'Motor_Termo', cst.DISCRETE_INPUTS, 3),
-            (self, 'Fire_Alarm', cst.DISCRETE_INPUTS, 4),
-            (self, 'Contact_Hatch', cst.DISCRETE_INPUTS, 5),
-            (self, 'Fan_start', cst.DISCRETE_INPUTS, 6),
-            (self, 'ZAS_state', cst.DISCRETE_INPUTS, 7)
-        ]
-        self.coil_list = [
-            (self, 'ZAS', cst.COILS, 0),
-            (self, 'FAN_START', cst.COILS, 1),
-            (self, 'Reset', cst.COILS, 31)
-        ]
-        self.input_register_list = [
-            (self, 'INTERN_TEMPER', cst.ANALOG_INPUTS, 0),
-            (self, 'Alarm_code', cst.ANALOG_INPUTS, 2),
-            (self, 'INT_REGUL', cst.ANALOG_INPUTS, 3),
-            (self, 'EXT_REGUL', cst.ANALOG_INPUTS, 6),
-            (self, 'MODE_CODE', cst.ANALOG_INPUTS, 7),
-            (self, 'Power_W', cst.ANALOG_INPUTS, 8),
-            (self, 'Fan_current', cst.ANALOG_INPUTS, 9)
-        ]
-        self.holding_register_list = [
-            (self, 'DAC_LEVEL', cst.HOLDING_REGISTERS, 0),
-            (self, 'SL_ADDR', cst.HOLDING_REGISTERS, 10),
-            (self, 'RS485_BAUD', cst.HOLDING_REGISTERS, 11),
-            (self, 'MODE_CODE_H', cst.HOLDING_REGISTERS, 12),
-            (self, 'DEFAULT_POWER', cst.HOLDING_REGISTERS, 13),
-            (self, 'MAX_CURRENT', cst.HOLDING_REGISTERS, 14),
-            (self, 'Hatch_Timeout', cst.HOLDING_REGISTERS, 15),
-            (self, 'OVERLOAD_TIME', cst.HOLDING_REGISTERS, 16),
-            (self, 'MIN_CURRENT', cst.HOLDING_REGISTERS, 17),
-            (self, 'Press_timeout', cst.HOLDING_REGISTERS, 18),
-        ]
-
-        super().__init__(port, baudrate, autoupdate, autocommit, update_interval, commit_interval)
-
-    def internal_update_discrete_inputs(self):
-        discrete_data = self.rtu_master.execute(1, cst.READ_DISCRETE_INPUTS, 0, 8)
-        for reg in self.discrete_regs:
-            reg.__value__ = discrete_data[reg.address]
-
-    def internal_update_coil_data(self):
-        coil_data = self.rtu_master.execute(1, cst.READ_COILS, 0, 32)
-        for reg in self.coil_regs:
-            reg.__value__ = coil_data[reg.address]
-
-    def internal_update_analog_data(self):
-        analog_data = self.rtu_master.execute(1, cst.READ_INPUT_REGISTERS, 0, 10)
-        for reg in self.input_regs:
-            reg.__value__ = analog_data[reg.address]
-
-    def internal_update_holding_data(self):
-        holding_data = self.rtu_master.execute(1, cst.READ_HOLDING_REGISTERS, 0, 19)
-        for reg in self.holding_regs:
-            reg.__value__ = holding_data[reg.address]
-
-    def commit_holding(self):
-        if self['DAC_LEVEL'].modified:
-            try:
-                self.rtu_master.execute(1, cst.WRITE_MULTIPLE_REGISTERS, 0, output_value=[self['DAC_LEVEL'].value])
-            except:
-                self.communicate.ErrorCommitingRegister.emit('Error while commiting holding register(s)')
-            return True
-
-        regs_ = [self['SL_ADDR'],
-                  self['RS485_BAUD'],
-                  self['MODE_CODE_H'],
-                  self['DEFAULT_POWER'],
-                  self['MAX_CURRENT'],
-                  self['Hatch_Timeout'],
-                  self['OVERLOAD_TIME'],
-                  self['MIN_CURRENT'],
-                  self['Press_timeout']]
-
-        if sum([reg.modified for reg in regs_]) > 0:
-            try:
-                self.rtu_master.execute(1, cst.WRITE_MULTIPLE_REGISTERS, 10, output_value=[int(reg.value) for reg in regs_])
-            except:
-                self.communicate.ErrorCommitingRegister.emit('Error while commiting holding register(s)')
-            for reg in regs_:
-                reg.reset()
-            return True
+class SunlineDevice(SunlineDeviceBase):
+    def __init__(self, port=None, baudrate=None, autoupdate=True, autocommit=True, update_interval=0.1,
+                 commit_interval=1, slave=1, bus=None, weight=1.0, max_staleness=None):
+        self.init_registers(slave)
+        # Доля времени перегруженной линии (относительно других устройств) и допустимое
+        # время между обновлениями данных, с; см. fairness.FairScheduler
+        self.weight = weight
+        self.max_staleness = max_staleness
+        # Запись уставок совмещается с чтением таблицы holding в одном кадре FC23.
+        # Если прошивка ответит "недопустимая функция", устройство перейдёт на FC16 + FC3.
+        self.use_fc23 = True
+        # Чтения read(), которые сейчас выполняются: регистр -> Future
+        self._flights = {}
+        self._read_lock = Lock()
+
+        # Без явно заданной линии устройство владеет портом единолично
+        self.own_bus = bus is None
+        if self.own_bus:
+            bus = SunlineBus(port, baudrate, autoupdate, autocommit, update_interval, commit_interval)
+        self.bus = bus
+
+        self.start()
+
+    @property
+    def rtu_master(self):
+        return self.bus.rtu_master
+
+    def execute(self, *args, priority=PRIORITY_POLL, **kwargs):
+        return self.bus.execute(*args, priority=priority, **kwargs)
+
+    # Ставит кадр записи в очередь порта; holding по возможности пишется через FC23
+    # вместе с чтением таблицы. Возвращает (совмещённое чтение или None, future).
+    def submit_write(self, request):
+        read = None
+        if self.use_fc23 and request.reg_type == cst.HOLDING_REGISTERS:
+            read = self.combined_read(request)
+        if read is None:
+            future = self.submit(PRIORITY_WRITE, self.slave, request.funcode, request.address,
+                                 output_value=request.output_value)
+        else:
+            future = self.submit(PRIORITY_WRITE, self.slave, cst.READ_WRITE_MULTIPLE_REGISTERS, read.address,
+                                 read.count, output_value=request.values, write_starting_address_fc23=request.address)
+        return read, future
+
+    # Запрос чтения из полного плана таблицы holding, который покрывает записываемый диапазон.
+    # Запись адреса устройства в FC23 не совмещается: ответ придёт уже с другого адреса.
+    def combined_read(self, request):
+        if any(reg.name == self.slave_register for reg in request.registers):
+            return None
+        end = request.address + request.count
+        for read in self.holding_plan:
+            if read.address <= request.address and end <= read.address + read.count:
+                return read
+        return None
+
+    # Кадры всех изменённых групп ставятся в очередь порта разом и уходят подряд,
+    # без чтений между ними
+    def commit_registers(self):
+        # Изменения для отключённого устройства остаются в буфере до восстановления связи
+        if self.health.offline:
+            self.offline_writes()
+            return None
+        results, generations = self.commit_started()
+        pending = self.plan_commit()
+        while pending:
+            submitted = [(name, request) + self.submit_write(request) for name, request in pending]
+            pending = []
+            for name, request, read, future in submitted:
+                data = error = None
+                try:
+                    data = future.result()
+                except modbus.ModbusError as e:
+                    if read is not None and e.get_exception_code() == cst.ILLEGAL_FUNCTION:
+                        # Прошивка без FC23: эта и остальные записи уходят обычным путём
+                        self.use_fc23 = False
+                        pending.append((name, request))
+                        continue
+                    error = e
+                except Exception as e:
+                    error = e
+                self.apply_write(request, read, data, error, results[name])
+        self.commit_finished(results, generations)
+        self.communicate.RegistersCommited.emit()
+        return results
+
+    # Запросы ставятся в очередь порта все сразу, а ответы разбираются потом:
+    # так транспорт с конвейером может держать в канале несколько запросов
+    def submit_reads(self, tables=None):
+        submitted = []
+        for name, plan, priority in self.read_tables():
+            if tables is not None and name not in tables:
+                continue
+            futures = [(request, self.submit(priority, self.slave, request.funcode, request.address, request.count))
+                       for request in plan]
+            submitted.append((name, futures))
+        return submitted
 
-        return False
+    def submit_plans(self, plans):
+        submitted = []
+        for name, plan in plans:
+            futures = [(request, self.submit(self.read_priority(name, request),
+                                             self.slave, request.funcode, request.address, request.count))
+                       for request in plan]
+            submitted.append((name, futures))
+        return submitted
 
-    def commit_coils(self):
-        if self['ZAS'].modified or self['FAN_START'].modified:
+    def submit_due_reads(self, now=None):
+        return self.submit_plans(self.due_reads(now))
+
+    # Внеочередное чтение указанных регистров независимо от их класса опроса
+    def submit_registers(self, registers, priority=PRIORITY_POLL):
+        submitted = []
+        for name, table in self.poller.tables:
+            due = tuple(reg for reg in table if reg in registers)
+            if due:
+                futures = [(request, self.submit(priority, self.slave, request.funcode, request.address,
+                                                 request.count))
+                           for request in self.poller.plan(due, table)]
+                submitted.append((name, futures))
+        return submitted
+
+    # Значения регистров не старше max_age секунд: свежие берутся из кэша, остальные
+    # читаются с линии. Если те же регистры уже читаются по запросу другого потока,
+    # чтение не повторяется, а ожидается его результат (single-flight).
+    def read(self, names, max_age: float = 0, priority=PRIORITY_POLL):
+        now = time.monotonic()
+        regs = self.registers(names)
+        own = []
+        flights = set()
+        with self._read_lock:
+            for reg in regs:
+                if reg.is_fresh(now, max_age):
+                    continue
+                flight = self._flights.get(reg)
+                if flight is None:
+                    own.append(reg)
+                else:
+                    flights.add(flight)
+            if own:
+                flight = Future()
+                for reg in own:
+                    self._flights[reg] = flight
+        if own:
             try:
-                self.rtu_master.execute(1, cst.WRITE_MULTIPLE_COILS, 0, output_value=[self['ZAS'].value, self['FAN_START'].value])
-            except:
-                self.communicate.ErrorCommitingRegister.emit('Error while commiting coil register(s)')
-            self['ZAS'].reset()
-            self['FAN_START'].reset()
-            return True
-
-        if self['Reset'].modified:
+                self.apply_reads(self.submit_registers(own, priority))
+            finally:
+                with self._read_lock:
+                    for reg in own:
+                        del self._flights[reg]
+                flight.set_result(None)
+        for flight in flights:
+            flight.result()
+        return self.fresh_values(regs, now, max_age)
+
+    def apply_reads(self, submitted):
+        outcomes = []
+        for name, futures in submitted:
             try:
-                self.rtu_master.execute(1, cst.WRITE_MULTIPLE_COILS, 31, output_value=[self['Reset'].value])
-            except:
-                self.communicate.ErrorCommitingRegister.emit('Error while commiting coil register(s)')
-            self['Reset'].reset()
-            return True
+                for request, future in futures:
+                    self.read_done(request, future.result())
+                    outcomes.append((name, None))
+            except Exception as e:
+                outcomes.append((name, e))
+        return self.reads_finished(outcomes)
+
+    def update_discrete_inputs(self):
+        self.apply_reads(self.submit_reads(['discrete']))
+
+    def update_coil_data(self):
+        self.apply_reads(self.submit_reads(['coil']))
+
+    def update_analog_data(self):
+        self.apply_reads(self.submit_reads(['analog']))
+
+    def update_holding_data(self):
+        self.apply_reads(self.submit_reads(['holding']))
+
+    def update_registers(self):
+        self.apply_reads(self.submit_reads())
+
+        self.communicate.RegistersUpdated.emit()
+
+        #print(datetime.now(), 'updated!')
+
+    def stop(self):
+        if self.own_bus:
+            self.bus.stop()
+        else:
+            self.bus.remove_device(self)
+
+    def start(self):
+        self.bus.add_device(self)
+        if self.own_bus:
+            self.bus.start()
+
+
+class AutoTransformer(SunlineDevice):
+    slave_register = 'SL_ADDR'
 
-        return False
+    discrete_input_list = [
+        ('Alarm', cst.DISCRETE_INPUTS, 0, POLL_FAST),
+        ('Initial_JP', cst.DISCRETE_INPUTS, 1, POLL_FAST),
+        ('Press_rel', cst.DISCRETE_INPUTS, 2, POLL_FAST),
+        ('Motor_Termo', cst.DISCRETE_INPUTS, 3, POLL_FAST),
+        ('Fire_Alarm', cst.DISCRETE_INPUTS, 4, POLL_FAST),
+        ('Contact_Hatch', cst.DISCRETE_INPUTS, 5, POLL_FAST),
+        ('Fan_start', cst.DISCRETE_INPUTS, 6, POLL_FAST),
+        ('ZAS_state', cst.DISCRETE_INPUTS, 7, POLL_FAST)
+    ]
+    coil_list = [
+        ('ZAS', cst.COILS, 0, POLL_NORMAL),
+        ('FAN_START', cst.COILS, 1, POLL_NORMAL),
+        ('Reset', cst.COILS, 31, POLL_ON_DEMAND)
+    ]
+    input_register_list = [
+        ('INTERN_TEMPER', cst.ANALOG_INPUTS, 0, POLL_NORMAL),
+        ('Alarm_code', cst.ANALOG_INPUTS, 2, POLL_FAST),
+        ('INT_REGUL', cst.ANALOG_INPUTS, 3, POLL_NORMAL),
+        ('EXT_REGUL', cst.ANALOG_INPUTS, 6, POLL_NORMAL),
+        ('MODE_CODE', cst.ANALOG_INPUTS, 7, POLL_NORMAL),
+        ('Power_W', cst.ANALOG_INPUTS, 8, POLL_FAST),
+        ('Fan_current', cst.ANALOG_INPUTS, 9, POLL_FAST)
+    ]
+    holding_register_list = [
+        ('DAC_LEVEL', cst.HOLDING_REGISTERS, 0, POLL_NORMAL),
+        ('SL_ADDR', cst.HOLDING_REGISTERS, 10, POLL_SLOW),
+        ('RS485_BAUD', cst.HOLDING_REGISTERS, 11, POLL_SLOW),
+        ('MODE_CODE_H', cst.HOLDING_REGISTERS, 12, POLL_SLOW),
+        ('DEFAULT_POWER', cst.HOLDING_REGISTERS, 13, POLL_SLOW),
+        ('MAX_CURRENT', cst.HOLDING_REGISTERS, 14, POLL_SLOW),
+        ('Hatch_Timeout', cst.HOLDING_REGISTERS, 15, POLL_SLOW),
+        ('OVERLOAD_TIME', cst.HOLDING_REGISTERS, 16, POLL_SLOW),
+        ('MIN_CURRENT', cst.HOLDING_REGISTERS, 17, POLL_SLOW),
+        ('Press_timeout', cst.HOLDING_REGISTERS, 18, POLL_SLOW),
+    ]
@@ -0,0 +1,120 @@
+from planner import char_time, frame_gap
+from pdu import request_length, response_length
+
+# Пределы таймаута ответа, с
+MIN_RESPONSE_TIMEOUT = 0.02
+MAX_RESPONSE_TIMEOUT = 3
+# Время реакции устройства, пока на линии не получено ни одного ответа, с
+INITIAL_TURNAROUND = 0.1
+
+# Коэффициенты сглаживания как у TCP (RFC 6298)
+RTT_ALPHA = 0.125
+RTT_BETA = 0.25
+RTT_K = 4
+# Запас на дрожание планировщика ОС и задержку USB-адаптера (G в RFC 6298), с
+RTT_GRANULARITY = 0.01
+
+
+class RttEstimator:
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        # Множитель таймаута после запросов, на которые не дождались ответа (RFC 6298, 5.5)
+        self.backoff = 1
+
+    def update(self, sample: float):
+        if self.srtt is None:
+            self.srtt = sample
+            self.rttvar = sample / 2
+        else:
+            self.rttvar += RTT_BETA * (abs(self.srtt - sample) - self.rttvar)
+            self.srtt += RTT_ALPHA * (sample - self.srtt)
+        self.samples += 1
+        # Алгоритм Карна: удвоение отменяется первым же измеренным ответом
+        self.backoff = 1
+
+    def rto(self):
+        return self.srtt + max(RTT_GRANULARITY, RTT_K * self.rttvar)
+
+
+# Таймаут ответа для каждой транзакции: время передачи запроса и ответа на скорости линии
+# плюс оценка времени реакции устройства (SRTT + max(G, 4 * RTTVAR)). Оценка ведётся по каждому
+# адресу отдельно; для устройства, которое ещё не отвечало, берётся общая оценка линии.
+# Аргументы timeout() и observe() повторяют аргументы execute() мастеров modbus_tk.
+class ResponseTimeouts:
+    def __init__(self, baudrate: int, floor: float = MIN_RESPONSE_TIMEOUT,
+                 ceiling: float = MAX_RESPONSE_TIMEOUT, initial: float = INITIAL_TURNAROUND):
+        self.baudrate = baudrate
+        self.floor = floor
+        self.ceiling = ceiling
+        self.initial = initial
+        self.line = RttEstimator()
+        self.devices = {}
+        # Адреса отключённых устройств: проверка связи ждёт ответа весь потолок таймаута
+        self.probing = set()
+
+    # Оценка устройства, а пока оно не отвечало - оценка линии
+    def estimator(self, slave: int):
+        estimator = self.devices.get(slave)
+        if estimator is None or estimator.srtt is None:
+            return self.line
+        return estimator
+
+    def wire_time(self, funcode: int, quantity_of_x: int = 0, output_value=0):
+        chars = request_length(funcode, quantity_of_x, output_value) + response_length(funcode, quantity_of_x)
+        return chars * char_time(self.baudrate) + 2 * frame_gap(self.baudrate)
+
+    def turnaround(self, slave: int):
+        estimator = self.estimator(slave)
+        turnaround = self.initial if estimator.srtt is None else estimator.rto()
+        if slave in self.devices:
+            turnaround *= self.devices[slave].backoff
+        return turnaround
+
+    # Ожидаемая длительность транзакции (без запаса на разброс), с
+    def expected(self, slave: int, funcode: int, quantity_of_x: int = 0):
+        estimator = self.estimator(slave)
+        turnaround = self.initial if estimator.srtt is None else estimator.srtt
+        return self.wire_time(funcode, quantity_of_x) + turnaround
+
+    def timeout(self, slave: int, funcode: int, starting_address: int = 0, quantity_of_x: int = 0,
+                output_value=0, **kwargs):
+        if slave in self.probing:
+            return self.ceiling
+        timeout = self.wire_time(funcode, quantity_of_x, output_value) + self.turnaround(slave)
+        return min(self.ceiling, max(self.floor, timeout))
+
+    # Учитывается только успешный обмен: по таймауту время реакции неизвестно
+    def observe(self, elapsed: float, slave: int, funcode: int, starting_address: int = 0,
+                quantity_of_x: int = 0, output_value=0, **kwargs):
+        if slave == 0:
+            # На широковещательный запрос устройства не отвечают
+            return
+        sample = max(0.0, elapsed - self.wire_time(funcode, quantity_of_x, output_value))
+        if slave not in self.devices:
+            self.devices[slave] = RttEstimator()
+        self.devices[slave].update(sample)
+        self.line.update(sample)
+
+    # Ответа не дождались: время реакции устройства могло вырасти, поэтому таймаут
+    # удваивается до потолка и не сжимается обратно, пока не придёт ответ (RFC 6298, 5.5)
+    def expired(self, slave: int, funcode: int, starting_address: int = 0, quantity_of_x: int = 0,
+                output_value=0, **kwargs):
+        if slave == 0:
+            return
+        if slave not in self.devices:
+            self.devices[slave] = RttEstimator()
+        if self.timeout(slave, funcode, starting_address, quantity_of_x, output_value) < self.ceiling:
+            self.devices[slave].backoff *= 2
+
+    def probe(self, slave: int, probing: bool):
+        if probing:
+            self.probing.add(slave)
+        else:
+            self.probing.discard(slave)
+
+    # Сглаженное время реакции и его разброс по адресам устройств, с
+    def statistics(self):
+        return {slave: (estimator.srtt, estimator.rttvar) for slave, estimator in self.devices.items()
+                if estimator.srtt is not None}
@@ -0,0 +1,103 @@
+from bisect import bisect_left
+
+# Что делать с тактами, пропущенными из-за долгого цикла (например, таймаута 3 с):
+# пропустить их и дождаться следующего такта сетки или выполнить один цикл сразу
+TICK_SKIP = 'skip'
+TICK_COALESCE = 'coalesce'
+
+# Верхние границы корзин гистограмм времени, с
+TIMING_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5)
+
+
+class Histogram:
+    def __init__(self, bounds=TIMING_BUCKETS):
+        self.bounds = tuple(bounds)
+        self.reset()
+
+    def reset(self):
+        # Последняя корзина - всё, что больше последней границы
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    # Верхняя граница корзины, в которую попадает квантиль p (0..1)
+    def percentile(self, p: float):
+        if not self.count:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def buckets(self):
+        return list(zip(self.bounds + (float('inf'),), self.counts))
+
+    def __repr__(self):
+        return 'Histogram(n=%d, mean=%.4f, p99=%.4f, max=%.4f)' % \
+               (self.count, self.mean, self.percentile(0.99), self.max)
+
+
+# Расписание периодического цикла по абсолютным срокам на монотонных часах.
+# Следующий срок отсчитывается от предыдущего, а не от конца цикла, поэтому
+# время обмена не накапливается в периоде. Сетка тактов сохраняется и после
+# пропусков: долгий цикл не вызывает пачку догоняющих циклов подряд.
+class Deadline:
+    def __init__(self, interval: float, missed: str = TICK_COALESCE):
+        self.interval = interval
+        self.missed_policy = missed
+        self.next_tick = None
+        # Сколько тактов пропущено из-за того, что цикл не уложился в период
+        self.missed = 0
+        # Опоздание начала цикла относительно срока и длительность цикла, с
+        self.lateness = Histogram()
+        self.duration = Histogram()
+
+    def start(self, now: float):
+        self.next_tick = now
+
+    def delay(self, now: float):
+        return max(0.0, self.next_tick - now)
+
+    def begin(self, now: float):
+        self.lateness.add(max(0.0, now - self.next_tick))
+        return now
+
+    def end(self, started: float, now: float):
+        self.duration.add(now - started)
+        if self.interval <= 0:
+            self.next_tick = now
+            return
+        self.next_tick += self.interval
+        if self.next_tick > now:
+            return
+        overdue = int((now - self.next_tick) // self.interval) + 1
+        if self.missed_policy == TICK_COALESCE:
+            # Все просроченные такты сливаются в один цикл, который начнётся сразу
+            overdue -= 1
+        self.missed += overdue
+        self.next_tick += overdue * self.interval
+
+    def statistics(self):
+        return {'interval': self.interval,
+                'missed': self.missed,
+                'lateness': self.lateness,
+                'duration': self.duration}
+
+    def reset_statistics(self):
+        self.missed = 0
+        self.lateness.reset()
+        self.duration.reset()
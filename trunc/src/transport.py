@@ -0,0 +1,195 @@
+import os
+import select
+import socket
+import time
+from array import array
+from urllib.parse import urlsplit, parse_qs
+from modbus_tk import modbus_rtu, modbus_tcp
+from modbus_tk.modbus_rtu_over_tcp import RtuOverTcpMaster
+from serial import Serial
+from pipeline import PipelinedTcpClient
+from rtu import FastRtuMixin, frame_length, EXCEPTION_FRAME_LENGTH, MAX_FRAME_LENGTH
+from planner import frame_gap
+from pdu import build_pdu
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Транспорт выбирается по адресу:
+#   COM3, /dev/ttyUSB0, rtu:///dev/ttyUSB0 - Modbus RTU через последовательный порт
+#   rtu+tcp://10.0.0.5:4001                 - кадры RTU через шлюз Ethernet-RS485
+#   tcp://10.0.0.5:502                      - Modbus TCP
+#   tcp://10.0.0.5:502?window=8             - Modbus TCP с конвейером до 8 запросов
+#   rtu:///dev/ttyUSB0?low_latency=0        - без настройки порта на минимальную задержку
+SERIAL_SCHEMES = ('', 'rtu', 'serial')
+RTU_OVER_TCP_SCHEMES = ('rtu+tcp', 'rtutcp')
+TCP_SCHEMES = ('tcp', 'modbus+tcp')
+
+DEFAULT_TCP_PORT = 502
+
+
+def parse_url(url: str):
+    if '://' not in url:
+        return '', url, None
+    parts = urlsplit(url)
+    scheme = parts.scheme.lower()
+    if scheme in SERIAL_SCHEMES:
+        return scheme, parts.netloc + parts.path, None
+    return scheme, parts.hostname, parts.port or DEFAULT_TCP_PORT
+
+
+def url_params(url: str):
+    if '://' not in url:
+        return {}
+    return {key: values[-1] for key, values in parse_qs(urlsplit(url).query).items()}
+
+
+def is_network(url: str):
+    return parse_url(url)[0] not in SERIAL_SCHEMES
+
+
+def configure_socket(sock):
+    # Маленькие кадры Modbus не должны ждать алгоритма Нейгла
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+
+# Ответ, который пришёл на широковещательный запрос, отбрасывается: его ждать некому
+def discard_pending(sock):
+    while select.select([sock], [], [], 0)[0]:
+        if not sock.recv(4096):
+            return
+
+
+class PersistentTcpMaster(modbus_tcp.TcpMaster):
+    # Пауза после широковещательного запроса, пока шлюз передаёт его на линию, с
+    broadcast_turnaround = 0.1
+
+    def _do_open(self):
+        super()._do_open()
+        configure_socket(self._sock)
+
+    def execute(self, slave, function_code, starting_address, quantity_of_x=0, output_value=0,
+                write_starting_address_fc23=0, **kwargs):
+        if slave != 0 or kwargs:
+            return super().execute(slave, function_code, starting_address, quantity_of_x, output_value,
+                                   write_starting_address_fc23=write_starting_address_fc23, **kwargs)
+        # Шлюз передаёт unit 0 на линию RS-485 широковещательно и не отвечает
+        self.open()
+        pdu = build_pdu(function_code, starting_address, quantity_of_x, output_value, write_starting_address_fc23)
+        self._send(modbus_tcp.TcpQuery().build_request(pdu, 0))
+        time.sleep(self.broadcast_turnaround)
+        discard_pending(self._sock)
+        return ()
+
+    def _send(self, request):
+        self._sent_transaction = request[:2]
+        super()._send(request)
+
+    # Ответ, опоздавший к уже истёкшему запросу, приходит перед ответом на следующий:
+    # такие ответы пропускаются по идентификатору транзакции, иначе поток сдвигается навсегда
+    def _recv(self, expected_length=-1):
+        while True:
+            response = super()._recv(expected_length)
+            if not response:
+                raise ConnectionResetError('Connection closed by %s:%d' % (self._host, self._port))
+            if len(response) < 2 or response[:2] == self._sent_transaction:
+                return response
+
+
+TIOCGSERIAL = 0x541e
+TIOCSSERIAL = 0x541f
+ASYNC_LOW_LATENCY = 0x2000
+
+
+# Драйвер USB-RS485 по умолчанию копит принятые байты до 16 мс, прежде чем отдать их.
+# В Linux это отключают флаг ASYNC_LOW_LATENCY и таймер задержки FTDI; без прав
+# или на другой ОС настройка просто пропускается.
+def set_low_latency(serial):
+    if fcntl is None:
+        return
+    try:
+        buf = array('i', [0] * 64)
+        fcntl.ioctl(serial.fd, TIOCGSERIAL, buf, True)
+        buf[4] |= ASYNC_LOW_LATENCY
+        fcntl.ioctl(serial.fd, TIOCSSERIAL, buf)
+    except (OSError, AttributeError):
+        pass
+    timer = '/sys/bus/usb-serial/devices/%s/latency_timer' % os.path.basename(os.path.realpath(serial.port))
+    try:
+        with open(timer, 'w') as f:
+            f.write('1')
+    except OSError:
+        pass
+
+
+class FastRtuMaster(FastRtuMixin, modbus_rtu.RtuMaster):
+    low_latency = True
+    _gap_baudrate = None
+
+    def _do_open(self):
+        super()._do_open()
+        if self.low_latency:
+            set_low_latency(self._serial)
+
+    # Ответ считается принятым, как только пришло ожидаемое по коду функции число байт
+    # (или 5 байт исключения), а не по таймауту порта. Если длина неизвестна,
+    # конец кадра определяется паузой t3.5.
+    def _recv(self, expected_length=-1):
+        serial = self._serial
+        if serial.baudrate != self._gap_baudrate:
+            self._gap_baudrate = serial.baudrate
+            serial.inter_byte_timeout = frame_gap(serial.baudrate)
+        if expected_length < 0:
+            return serial.read(MAX_FRAME_LENGTH)
+        # Сначала читаем не больше длины исключения: по ней видно, ждать ли остальное
+        response = serial.read(min(expected_length, EXCEPTION_FRAME_LENGTH))
+        expected_length = frame_length(response, expected_length)
+        while response and len(response) < expected_length:
+            chunk = serial.read(expected_length - len(response))
+            if not chunk:
+                break
+            response += chunk
+            expected_length = frame_length(response, expected_length)
+        return response
+
+
+class PersistentRtuOverTcpMaster(FastRtuMixin, RtuOverTcpMaster):
+    def _do_open(self):
+        super()._do_open()
+        configure_socket(self._sock)
+
+    def _recv(self, expected_length=-1):
+        # Родительская реализация зацикливается, если шлюз закрыл соединение
+        response = b''
+        while expected_length < 0 or len(response) < expected_length:
+            rcv_bytes = self._sock.recv(expected_length - len(response) if expected_length > 0 else 256)
+            if not rcv_bytes:
+                raise ConnectionResetError('Connection closed by %s:%d' % (self._host, self._port))
+            response += rcv_bytes
+            if expected_length < 0:
+                break
+            expected_length = frame_length(response, expected_length)
+        return response
+
+
+def open_master(url: str, baudrate=19200, timeout=3):
+    scheme, target, port = parse_url(url)
+    if scheme in SERIAL_SCHEMES:
+        master = FastRtuMaster(Serial(port=target, baudrate=baudrate, \
+                                      bytesize=8, parity='N', stopbits=1, xonxoff=0))
+        master.low_latency = url_params(url).get('low_latency', '1') != '0'
+    elif scheme in RTU_OVER_TCP_SCHEMES:
+        master = PersistentRtuOverTcpMaster(host=target, port=port, timeout_in_sec=timeout)
+    elif scheme in TCP_SCHEMES:
+        window = int(url_params(url).get('window', 1))
+        if window > 1:
+            master = PipelinedTcpClient(target, port, window, timeout)
+        else:
+            master = PersistentTcpMaster(host=target, port=port, timeout_in_sec=timeout)
+    else:
+        raise ValueError('Unknown transport %s' % scheme)
+    master.set_timeout(timeout)
+    return master
@@ -0,0 +1,175 @@
+import os
+import select
+import socket
+import struct
+import sys
+import threading
+import time
+import pytest
+from modbus_tk import modbus, modbus_rtu, modbus_tcp
+import modbus_tk.defines as cst
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from sunline import AutoTransformer  # noqa: E402
+
+WRITE_FUNCCODES = (cst.WRITE_SINGLE_COIL, cst.WRITE_SINGLE_REGISTER, cst.WRITE_MULTIPLE_COILS,
+                   cst.WRITE_MULTIPLE_REGISTERS, cst.READ_WRITE_MULTIPLE_REGISTERS)
+
+
+# Таблицы устройства по его карте регистров: от нулевого адреса до последнего регистра
+def table_size(registers):
+    return max(address for _, _, address, *_ in registers) + 1
+
+
+def make_databank(slaves, device_class=AutoTransformer):
+    db = modbus.Databank(error_on_missing_slave=False)
+    for slave in slaves:
+        block = db.add_slave(slave)
+        block.add_block('di', cst.DISCRETE_INPUTS, 0, table_size(device_class.discrete_input_list))
+        block.add_block('co', cst.COILS, 0, table_size(device_class.coil_list))
+        block.add_block('ir', cst.ANALOG_INPUTS, 0, table_size(device_class.input_register_list))
+        block.add_block('hr', cst.HOLDING_REGISTERS, 0, table_size(device_class.holding_register_list))
+    return db
+
+
+# Шлюз Modbus TCP на локальном порту: устройства из silent не отвечают
+class Gateway:
+    def __init__(self, slaves=(1,)):
+        self.db = make_databank(slaves)
+        self.silent = set()
+        self.requests = []
+        # Устройства, которые отвечают на запись исключением или теряют её без ответа
+        self.reject_writes = set()
+        self.drop_writes = set()
+        # Задержка ответа, с
+        self.delay = 0
+        self.sock = socket.socket()
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(5)
+        self.connections = []
+        threading.Thread(target=self.accept, daemon=True).start()
+
+    @property
+    def url(self):
+        return 'tcp://127.0.0.1:%d' % self.sock.getsockname()[1]
+
+    def holding(self, slave, address):
+        return self.db.get_slave(slave).get_values('hr', address, 1)[0]
+
+    def accept(self):
+        while True:
+            try:
+                connection, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections.append(connection)
+            threading.Thread(target=self.serve, args=(connection,), daemon=True).start()
+
+    def receive(self, connection, length):
+        data = b''
+        while len(data) < length:
+            chunk = connection.recv(length - len(data))
+            if not chunk:
+                raise EOFError
+            data += chunk
+        return data
+
+    def serve(self, connection):
+        try:
+            while True:
+                head = self.receive(connection, 7)
+                request = head + self.receive(connection, struct.unpack('>HHHB', head)[2] - 1)
+                unit = head[6]
+                self.requests.append((unit, request[7]))
+                if unit == 0:
+                    for slave in self.db._slaves.values():
+                        slave.handle_request(request[7:], broadcast=True)
+                    continue
+                if unit in self.silent:
+                    continue
+                if request[7] in WRITE_FUNCCODES:
+                    if unit in self.drop_writes:
+                        continue
+                    if unit in self.reject_writes:
+                        connection.sendall(head[:4] + struct.pack('>HB', 3, unit) +
+                                           bytes([request[7] | 0x80, cst.ILLEGAL_DATA_VALUE]))
+                        continue
+                if self.delay:
+                    time.sleep(self.delay)
+                connection.sendall(self.db.handle_request(modbus_tcp.TcpQuery(), request))
+        except (EOFError, OSError):
+            connection.close()
+
+    def close(self):
+        self.sock.close()
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+                connection.close()
+            except OSError:
+                pass
+
+
+# Линия RTU на псевдотерминале: конец кадра - пауза в приёме
+class SerialLine:
+    def __init__(self, slaves=(1,), silence=0.004):
+        import pty
+        import tty
+        self.fd, slave_fd = pty.openpty()
+        tty.setraw(slave_fd)
+        self.port = os.ttyname(slave_fd)
+        self._slave_fd = slave_fd
+        self.db = make_databank(slaves)
+        self.silent = set()
+        self.requests = []
+        self.silence = silence
+        self.running = True
+        threading.Thread(target=self.serve, daemon=True).start()
+
+    def holding(self, slave, address):
+        return self.db.get_slave(slave).get_values('hr', address, 1)[0]
+
+    def serve(self):
+        buffer = b''
+        while self.running:
+            if select.select([self.fd], [], [], self.silence)[0]:
+                buffer += os.read(self.fd, 1024)
+                continue
+            if not buffer:
+                continue
+            request, buffer = buffer, b''
+            query = modbus_rtu.RtuQuery()
+            try:
+                unit, pdu = query.parse_request(request)
+            except Exception:
+                continue
+            self.requests.append((unit, pdu[0]))
+            if unit == 0:
+                for slave in self.db._slaves.values():
+                    slave.handle_request(pdu, broadcast=True)
+                continue
+            if unit in self.silent:
+                continue
+            response = self.db.handle_request(query, request)
+            if response:
+                os.write(self.fd, response)
+
+    def close(self):
+        self.running = False
+
+
+@pytest.fixture
+def serial_line():
+    pytest.importorskip('pty')
+    line = SerialLine(slaves=(1, 2))
+    yield line
+    line.close()
+
+
+@pytest.fixture
+def gateway():
+    gateway = Gateway(slaves=(1, 2))
+    yield gateway
+    gateway.close()
@@ -0,0 +1,123 @@
+import asyncio
+import threading
+import time
+import pytest
+import modbus_tk.defines as cst
+from conftest import WRITE_FUNCCODES
+from aiosunline import AsyncSunlineBus, AsyncAutoTransformer
+from rtu import build_frame
+from sunline import SunlineBus, AutoTransformer
+
+
+# Шлюз RTU поверх TCP, который молчит на первый запрос и закрывает соединение
+def test_closed_connection_is_reopened():
+    async def main():
+        connections = []
+
+        async def serve(reader, writer):
+            connections.append(writer)
+            await reader.read(256)
+            if len(connections) == 1:
+                await asyncio.sleep(0.3)
+                writer.close()
+                return
+            # Ответ FC3 на один регистр устройства 1 со значением 7
+            writer.write(build_frame(1, bytes([3, 2, 0, 7])))
+            await writer.drain()
+
+        server = await asyncio.start_server(serve, '127.0.0.1', 0)
+        bus = AsyncSunlineBus('rtu+tcp://127.0.0.1:%d' % server.sockets[0].getsockname()[1], 19200, timeout=0.2)
+        await bus.open()
+        try:
+            with pytest.raises(Exception):
+                await bus.execute(1, cst.READ_HOLDING_REGISTERS, 0, 1)
+            await asyncio.sleep(0.2)
+            started = time.monotonic()
+            with pytest.raises(ConnectionResetError):
+                await asyncio.wait_for(bus.execute(1, cst.READ_HOLDING_REGISTERS, 0, 1), 1)
+            assert time.monotonic() - started < 0.1
+            assert await asyncio.wait_for(bus.execute(1, cst.READ_HOLDING_REGISTERS, 0, 1), 1) == (7,)
+            assert len(connections) == 2
+        finally:
+            await asyncio.wait_for(bus.close(), 1)
+            server.close()
+
+    # Без обработки конца потока цикл событий зацикливается и не отдаёт управление
+    errors = []
+    thread = threading.Thread(target=lambda: errors.append(run(main)), daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert errors == [None]
+
+
+def run(main):
+    try:
+        asyncio.run(main())
+    except Exception as e:
+        return e
+
+
+
+
+# read() обоих движков отдаёт значение устройства, а не неотправленную правку,
+# и сообщает об устаревших значениях исключением
+def test_read_matches_threaded_engine(gateway):
+    gateway.db.get_slave(1).set_values('hr', 14, [40])
+    gateway.silent.add(2)
+
+    bus = SunlineBus(gateway.url, None, autoupdate=False, autocommit=False, max_timeout=0.2)
+    device, silent = [AutoTransformer(bus=bus, slave=slave) for slave in (1, 2)]
+    bus.start()
+    try:
+        device['MAX_CURRENT'].value = 44
+        assert device.read(['MAX_CURRENT']) == {'MAX_CURRENT': 40}
+        assert device.read(['MAX_CURRENT'], max_age=None) == {'MAX_CURRENT': 40}
+        with pytest.raises(Exception, match='Unknown register'):
+            device.read(['NO_SUCH_REGISTER'])
+        with pytest.raises(Exception, match='were not read'):
+            silent.read(['MAX_CURRENT'])
+    finally:
+        bus.stop()
+
+    async def main():
+        bus = AsyncSunlineBus(gateway.url, None, timeout=0.2)
+        await bus.open()
+        device, silent = [AsyncAutoTransformer(bus, slave) for slave in (1, 2)]
+        try:
+            device['MAX_CURRENT'].value = 44
+            assert await device.read(['MAX_CURRENT']) == {'MAX_CURRENT': 40}
+            assert await device.read(['MAX_CURRENT'], max_age=None) == {'MAX_CURRENT': 40}
+            with pytest.raises(Exception, match='Unknown register'):
+                await device.read(['NO_SUCH_REGISTER'])
+            with pytest.raises(Exception, match='were not read'):
+                await silent.read(['MAX_CURRENT'])
+        finally:
+            await bus.close()
+
+    assert run(main) is None
+
+
+# Правка во время записи не запускает вторую запись того же устройства параллельно первой
+def test_commits_of_one_device_do_not_overlap(gateway):
+    async def main():
+        bus = AsyncSunlineBus(gateway.url, None, update_interval=10, timeout=1, min_timeout=1, commit_delay=0.01)
+        await bus.open()
+        device = AsyncAutoTransformer(bus, 1)
+        bus.start()
+        try:
+            await asyncio.sleep(0.1)
+            gateway.delay = 0.2
+            device['DAC_LEVEL'].value = 5
+            await asyncio.sleep(0.1)
+            device['MAX_CURRENT'].value = 6
+            deadline = time.monotonic() + 2
+            while device.modified and time.monotonic() < deadline:
+                await asyncio.sleep(0.01)
+            assert not device.modified
+            assert gateway.holding(1, 0) == 5 and gateway.holding(1, 14) == 6
+        finally:
+            await bus.close()
+
+    assert run(main) is None
+    assert len([request for request in gateway.requests if request[1] in WRITE_FUNCCODES]) == 2
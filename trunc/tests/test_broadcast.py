@@ -0,0 +1,21 @@
+import time
+import pytest
+from sunline import SunlineBus, AutoTransformer
+
+
+@pytest.mark.parametrize('params', ['', '?window=4'])
+def test_broadcast_on_tcp_line(gateway, params):
+    bus = SunlineBus(gateway.url + params, None, autoupdate=False, autocommit=False, max_timeout=0.5)
+    devices = [AutoTransformer(bus=bus, slave=slave) for slave in (1, 2)]
+    bus.start()
+    try:
+        started = time.monotonic()
+        assert bus.broadcast({'DEFAULT_POWER': 42, 'MAX_CURRENT': 43}) == {}
+        assert time.monotonic() - started < 0.5
+        assert [gateway.holding(slave, 13) for slave in (1, 2)] == [42, 42]
+        assert [gateway.holding(slave, 14) for slave in (1, 2)] == [43, 43]
+        assert (0, 16) in gateway.requests
+        # После широковещательного запроса линия продолжает работать как обычно
+        assert devices[1].read(['MAX_CURRENT']) == {'MAX_CURRENT': 43}
+    finally:
+        bus.stop()
@@ -0,0 +1,104 @@
+import time
+from conftest import WRITE_FUNCCODES
+from sunline import SunlineBus, AutoTransformer, COMMIT_RETRY_DELAY
+
+
+def make_device(gateway):
+    bus = SunlineBus(gateway.url, None, autoupdate=False, autocommit=False, max_timeout=0.3)
+    device = AutoTransformer(bus=bus, slave=1)
+    bus.start()
+    return bus, device
+
+
+def test_float_setpoint_is_committed_once(gateway):
+    bus, device = make_device(gateway)
+    try:
+        device['Hatch_Timeout'].value = 2.5
+        result = device.commit_registers()
+        assert result['holding']['written'] == ['Hatch_Timeout']
+        assert not device['Hatch_Timeout'].modified
+        assert device['Hatch_Timeout'].value == 2
+        assert gateway.holding(1, 15) == 2
+        assert device.plan_commit() == []
+    finally:
+        bus.stop()
+
+
+def wait_for(condition, limit=2.0):
+    deadline = time.monotonic() + limit
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.005)
+    return condition()
+
+
+def writes(gateway, unit):
+    return len([request for request in gateway.requests if request[0] == unit and request[1] in WRITE_FUNCCODES])
+
+
+def test_lost_write_is_retried_with_backoff(gateway):
+    bus = SunlineBus(gateway.url, None, max_timeout=0.1)
+    device = AutoTransformer(bus=bus, slave=2)
+    bus.start()
+    try:
+        gateway.drop_writes.add(2)
+        device['MAX_CURRENT'].value = 5
+        time.sleep(1.2)
+        # Попытки через 0.03, 0.5 и 1 с вместо записи на каждом проходе
+        assert 1 <= writes(gateway, 2) <= 3
+        assert device['MAX_CURRENT'].modified
+        assert device.commit_backoff >= COMMIT_RETRY_DELAY
+        gateway.drop_writes.clear()
+        assert wait_for(lambda: not device['MAX_CURRENT'].modified, 3)
+        assert gateway.holding(2, 14) == 5
+        assert device.commit_backoff == 0
+    finally:
+        bus.stop()
+
+
+def test_rejected_write_is_not_repeated(gateway):
+    bus = SunlineBus(gateway.url, None, max_timeout=0.1)
+    device = AutoTransformer(bus=bus, slave=2)
+    bus.start()
+    try:
+        assert wait_for(lambda: device['MAX_CURRENT'].__value__ is not None)
+        gateway.reject_writes.add(2)
+        device['MAX_CURRENT'].value = 5
+        time.sleep(0.5)
+        assert writes(gateway, 2) == 1
+        assert not device['MAX_CURRENT'].modified
+        assert device['MAX_CURRENT'].value == 0
+        assert device.last_commit['holding']['failed'] == ['MAX_CURRENT']
+    finally:
+        bus.stop()
+
+
+def test_edit_during_write_is_sent_right_after_it(gateway):
+    bus = SunlineBus(gateway.url, None, min_timeout=1, max_timeout=1)
+    device = AutoTransformer(bus=bus, slave=1)
+    bus.start()
+    try:
+        assert wait_for(lambda: device['MAX_CURRENT'].__value__ is not None)
+        gateway.delay = 0.2
+        device['MAX_CURRENT'].value = 5
+        time.sleep(0.1)
+        device['MAX_CURRENT'].value = 6
+        assert wait_for(lambda: gateway.holding(1, 14) == 6, 1)
+        assert wait_for(lambda: not device.modified, 0.5)
+        assert device.commit_backoff == 0
+    finally:
+        bus.stop()
+
+
+# Ответ FC23 обновляет соседние регистры таблицы вместе с временем их получения
+def test_fc23_readback_is_fresh(gateway):
+    bus, device = make_device(gateway)
+    try:
+        gateway.db.get_slave(1).set_values('hr', 16, [21])
+        device['MAX_CURRENT'].value = 44
+        device.commit_registers()
+        assert gateway.requests[-1] == (1, 23)
+        requests = len(gateway.requests)
+        assert device.read(['OVERLOAD_TIME'], max_age=1) == {'OVERLOAD_TIME': 21}
+        assert len(gateway.requests) == requests
+    finally:
+        bus.stop()
@@ -0,0 +1,33 @@
+import time
+from PyQt5.QtCore import Qt
+from health import DEVICE_HEALTHY, DEVICE_OFFLINE
+from sunline import SunlineBus, AutoTransformer
+
+
+def wait_for(condition, limit=5.0):
+    deadline = time.monotonic() + limit
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+# Псевдотерминала нет в списке портов системы: наблюдатель за ним не следит,
+# и после потери связи порт переоткрывает сам поток порта
+def test_unlisted_port_reconnects(serial_line):
+    bus = SunlineBus(serial_line.port, 19200, autocommit=False, update_interval=0.05, max_timeout=0.2)
+    device = AutoTransformer(bus=bus, slave=1)
+    states = []
+    device.communicate.HealthChanged.connect(states.append, Qt.DirectConnection)
+    bus.start()
+    try:
+        assert bus.watcher is not None
+        assert wait_for(lambda: serial_line.requests)
+        worker = bus.io_worker
+        worker.call(worker.connection_lost).result()
+        assert wait_for(lambda: DEVICE_OFFLINE in states)
+        assert wait_for(lambda: worker.connected and device.health.state == DEVICE_HEALTHY)
+        requests = len(serial_line.requests)
+        assert wait_for(lambda: len(serial_line.requests) > requests + 5)
+        assert states[-1] == DEVICE_HEALTHY
+    finally:
+        bus.stop()
@@ -0,0 +1,78 @@
+import pytest
+
+from fairness import FairScheduler
+
+NOISY_COST = 0.5
+QUIET_COST = 0.05
+BUDGET = 0.3
+
+
+class Device:
+    def __init__(self, slave, weight=1, max_staleness=None):
+        self.slave = slave
+        self.weight = weight
+        self.max_staleness = max_staleness
+
+
+# Циклы раз в секунду: каждое выбранное устройство отвечает и получает время линии
+def simulate(costs, cycles=200, budget=BUDGET):
+    scheduler = FairScheduler()
+    busy = dict.fromkeys(costs, 0.0)
+    for cycle in range(cycles):
+        now = float(cycle)
+        for device in scheduler.select(list(costs.items()), now, budget, 1.0):
+            busy[device] += costs[device]
+            scheduler.updated(device, now)
+    return scheduler, busy
+
+
+def test_everything_served_while_plan_fits_budget():
+    devices = [Device(slave) for slave in range(1, 5)]
+    scheduler, _ = simulate({device: QUIET_COST for device in devices}, cycles=10)
+    assert all(scheduler.shares[device].served == 10 for device in devices)
+    assert all(scheduler.shares[device].deferred == 0 for device in devices)
+
+
+def test_noisy_slave_does_not_starve_quiet_ones():
+    noisy = Device(1)
+    quiet = [Device(slave) for slave in range(2, 6)]
+    costs = {noisy: NOISY_COST, **{device: QUIET_COST for device in quiet}}
+    scheduler, busy = simulate(costs)
+    # Время линии делится поровну, а не по числу запросов
+    for device in quiet:
+        assert busy[device] == pytest.approx(busy[noisy], rel=0.1)
+        assert scheduler.shares[device].served > 0.85 * 200
+    # Шумное устройство обслуживается реже, но не вытесняется совсем
+    assert 0 < scheduler.shares[noisy].served < 0.15 * 200
+    assert scheduler.shares[noisy].deferred > 0
+
+
+def test_weight_scales_share():
+    noisy = Device(1)
+    heavy = Device(2, weight=2)
+    light = Device(3)
+    costs = {noisy: NOISY_COST, heavy: 0.2, light: 0.2}
+    _, busy = simulate(costs, cycles=400)
+    assert busy[heavy] == pytest.approx(2 * busy[light], rel=0.15)
+    assert busy[light] == pytest.approx(busy[noisy], rel=0.15)
+
+
+def test_max_staleness_serves_out_of_turn():
+    noisy = Device(1, max_staleness=3.5)
+    quiet = [Device(slave) for slave in range(2, 6)]
+    costs = {noisy: NOISY_COST, **{device: QUIET_COST for device in quiet}}
+    scheduler, _ = simulate(costs)
+    share = scheduler.shares[noisy]
+    assert share.violations == 0
+    assert share.max_seen_staleness <= 3.5
+    assert share.served > 200 / 4
+    statistics = scheduler.statistics(200.0)
+    assert statistics[1]['violations'] == 0
+    assert statistics[2]['served'] > 0
+
+
+def test_forget_drops_share():
+    device = Device(1)
+    scheduler, _ = simulate({device: QUIET_COST}, cycles=2)
+    scheduler.forget(device)
+    assert device not in scheduler.shares
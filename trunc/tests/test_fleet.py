@@ -0,0 +1,48 @@
+import time
+from PyQt5.QtCore import Qt
+from fleet import Fleet
+from health import DeviceHealth
+from sunline import AutoTransformer
+
+
+def test_write_to_silent_device_fails(gateway):
+    fleet = Fleet()
+    healthy, silent = fleet.add_line(gateway.url, None, [(AutoTransformer, 1), (AutoTransformer, 2)],
+                                     max_timeout=0.2)
+    fleet.start()
+    try:
+        assert isinstance(healthy.health, DeviceHealth)
+        assert healthy.write('Hatch_Timeout', 7).result(10) == 7
+        assert gateway.holding(1, 15) == 7
+        gateway.silent.add(2)
+        # Запись не подтверждена устройством: Future завершается ошибкой, а не значением
+        assert isinstance(silent.write('Hatch_Timeout', 9).exception(10), Exception)
+        deadline = time.monotonic() + 10
+        while not silent.health.offline and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert silent.health.offline
+        assert isinstance(silent.write('Hatch_Timeout', 11).exception(10), ConnectionError)
+        assert gateway.holding(2, 15) == 0
+    finally:
+        fleet.stop()
+
+
+def test_commit_errors_are_not_read_errors(gateway):
+    gateway.reject_writes.add(1)
+    fleet = Fleet()
+    device, = fleet.add_line(gateway.url, None, [(AutoTransformer, 1)], max_timeout=0.2)
+    commit_errors = []
+    read_errors = []
+    # Сигналы испускает поток чтения координатора
+    device.communicate.ErrorCommitingRegister.connect(commit_errors.append, Qt.DirectConnection)
+    device.communicate.ErrorReadingRegister.connect(read_errors.append, Qt.DirectConnection)
+    fleet.start()
+    try:
+        assert isinstance(device.write('Hatch_Timeout', 9).exception(10), Exception)
+        deadline = time.monotonic() + 5
+        while not commit_errors and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert commit_errors == ['Error while commiting holding register(s): Hatch_Timeout']
+        assert not [message for message in read_errors if 'commiting' in message]
+    finally:
+        fleet.stop()
@@ -0,0 +1,76 @@
+import pytest
+import modbus_tk.defines as cst
+from health import DEVICE_OFFLINE
+from linkspeed import upgrade_link_speed
+from polling import POLL_SLOW
+from sunline import SunlineBus, AutoTransformer
+
+
+# Регистр за пределами карты стенда: на его чтение устройство отвечает исключением
+class SpareTransformer(AutoTransformer):
+    input_register_list = AutoTransformer.input_register_list + [('SPARE', cst.ANALOG_INPUTS, 200, POLL_SLOW)]
+
+
+def make_line(line, device_class=AutoTransformer):
+    bus = SunlineBus(line.port, 19200, autoupdate=False, autocommit=False, max_timeout=0.2, watch_ports=False)
+    devices = [device_class(bus=bus, slave=slave) for slave in (1, 2)]
+    bus.start()
+    return bus, devices
+
+
+def test_upgrade_switches_and_verifies(serial_line):
+    bus, devices = make_line(serial_line)
+    try:
+        messages = []
+        assert upgrade_link_speed(bus, rates=(38400, 28800), soak_time=0.3, progress=messages.append) == (38400, [])
+        assert bus.baudrate == 38400
+        assert serial_line.holding(1, 11) == serial_line.holding(2, 11) == 38400
+        assert messages == ['Переход на 38400 бод', 'Скорость линии 38400 бод']
+    finally:
+        bus.stop()
+
+
+def test_exception_reply_is_not_a_link_error(serial_line):
+    bus, devices = make_line(serial_line, SpareTransformer)
+    try:
+        assert upgrade_link_speed(bus, rates=(38400,), soak_time=0.3) == (38400, [])
+    finally:
+        bus.stop()
+
+
+def test_offline_device_blocks_upgrade(serial_line):
+    bus, devices = make_line(serial_line)
+    try:
+        devices[1].health.state = DEVICE_OFFLINE
+        messages = []
+        assert upgrade_link_speed(bus, rates=(38400,), soak_time=0, progress=messages.append) == \
+            (19200, [devices[1]])
+        assert serial_line.requests == []
+        assert messages == ['Нет связи с устройствами: 2. Скорость линии оставлена 19200 бод']
+    finally:
+        bus.stop()
+
+
+def test_failed_write_is_reported(serial_line):
+    bus, devices = make_line(serial_line)
+    try:
+        serial_line.silent.add(2)
+        messages = []
+        baudrate, lost = upgrade_link_speed(bus, rates=(38400,), soak_time=0, progress=messages.append)
+        assert (baudrate, lost) == (19200, [devices[1]])
+        assert 'Не удалось записать скорость 38400 бод в устройства: 2' in messages
+        assert not any(message.endswith('-') for message in messages)
+    finally:
+        bus.stop()
+
+
+def test_gateway_line_is_rejected(gateway):
+    bus = SunlineBus(gateway.url, 19200, autoupdate=False, autocommit=False, max_timeout=0.2)
+    AutoTransformer(bus=bus, slave=1)
+    bus.start()
+    try:
+        with pytest.raises(Exception):
+            upgrade_link_speed(bus, rates=(38400,), soak_time=0)
+        assert gateway.requests == []
+    finally:
+        bus.stop()
@@ -0,0 +1,37 @@
+import threading
+import modbus_tk.defines as cst
+from pipeline import PipelinedTcpClient
+
+
+def test_pipelined_requests(gateway):
+    gateway.db.get_slave(1).set_values('hr', 0, [5, 6, 7])
+    client = PipelinedTcpClient('127.0.0.1', gateway.sock.getsockname()[1], window=2, timeout=1)
+    try:
+        futures = [client.submit(1, cst.READ_HOLDING_REGISTERS, address, 1) for address in range(3)]
+        assert [future.result(2) for future in futures] == [(5,), (6,), (7,)]
+    finally:
+        client.close()
+
+
+# Соединение закрыли между open() и отправкой: запрос завершается ConnectionError,
+# а место в окне не теряется
+def test_submit_on_closed_connection(gateway):
+    client = PipelinedTcpClient('127.0.0.1', gateway.sock.getsockname()[1], window=1, timeout=1)
+    client.open()
+    client.close()
+    client.open = lambda: None
+
+    errors = []
+
+    def submit():
+        for slave in (1, 1, 1, 0):
+            try:
+                client.submit(slave, cst.WRITE_SINGLE_REGISTER, 0, output_value=1)
+            except Exception as e:
+                errors.append(type(e))
+
+    thread = threading.Thread(target=submit, daemon=True)
+    thread.start()
+    thread.join(2)
+    assert not thread.is_alive()
+    assert errors == [ConnectionError] * 4
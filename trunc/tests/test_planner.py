@@ -0,0 +1,82 @@
+import modbus_tk.defines as cst
+from planner import plan_reads, plan_writes, read_cost, MAX_READ_COUNT
+from polling import POLL_NORMAL
+from sunline import Register
+
+
+def registers(reg_type, addresses):
+    return [Register(None, 'r%d' % address, reg_type, address, POLL_NORMAL) for address in addresses]
+
+
+def spans(plan):
+    return [(request.address, request.count) for request in plan]
+
+
+def test_adjacent_and_small_gaps_are_merged():
+    regs = registers(cst.HOLDING_REGISTERS, [3, 0, 1, 5])
+    plan = plan_reads(regs, 19200)
+    assert spans(plan) == [(0, 6)]
+    assert [reg.address for reg in plan[0].registers] == [0, 1, 3, 5]
+    assert plan[0].funcode == cst.READ_HOLDING_REGISTERS
+
+
+def test_gap_is_read_only_when_cheaper_than_a_frame():
+    regs = registers(cst.HOLDING_REGISTERS, [0, 100])
+    assert spans(plan_reads(regs, 19200)) == [(0, 1), (100, 1)]
+    # На быстрой линии лишние адреса дешевле, пока не превышают времени отдельного кадра
+    gap = 0
+    while read_cost(115200, cst.HOLDING_REGISTERS, gap + 2) <= 2 * read_cost(115200, cst.HOLDING_REGISTERS, 1):
+        gap += 1
+    assert spans(plan_reads(registers(cst.HOLDING_REGISTERS, [0, gap]), 115200)) == [(0, gap + 1)]
+    assert len(plan_reads(registers(cst.HOLDING_REGISTERS, [0, gap + 1]), 115200)) == 2
+
+
+def test_bit_tables_pack_eight_per_byte():
+    regs = registers(cst.COILS, [0, 1, 31])
+    assert spans(plan_reads(regs, 19200)) == [(0, 32)]
+
+
+def test_request_never_exceeds_limit():
+    regs = registers(cst.ANALOG_INPUTS, range(0, 300))
+    plan = plan_reads(regs, 19200)
+    assert all(request.count <= MAX_READ_COUNT[cst.ANALOG_INPUTS] for request in plan)
+    assert sum(request.count for request in plan) == 300
+    assert spans(plan_reads(registers(cst.ANALOG_INPUTS, range(10)), 19200, max_count=4)) == \
+        [(0, 4), (4, 4), (8, 2)]
+
+
+def test_covered_registers_ride_along():
+    regs = registers(cst.HOLDING_REGISTERS, [0, 1, 2, 3, 50])
+    plan = plan_reads([regs[0], regs[3]], 19200, covered=regs)
+    assert spans(plan) == [(0, 4)]
+    assert plan[0].registers == regs[:4]
+
+
+def edited(regs, values):
+    for reg, value in zip(regs, values):
+        reg.__commit_buffer__ = value
+
+
+def test_writes_merge_gaps_with_known_values():
+    regs = registers(cst.HOLDING_REGISTERS, range(6))
+    for reg in regs:
+        reg.__value__ = 100 + reg.address
+    edited([regs[0], regs[3]], [1, 2])
+    assert [(request.address, request.values) for request in plan_writes(regs)] == [(0, [1]), (3, [2])]
+    plan = plan_writes(regs, gap_merge=2)
+    assert [(request.address, request.values) for request in plan] == [(0, [1, 101, 102, 2])]
+    assert plan[0].funcode == cst.WRITE_MULTIPLE_REGISTERS
+
+
+def test_writes_do_not_fill_unknown_gaps():
+    regs = registers(cst.HOLDING_REGISTERS, [0, 2])
+    edited(regs, [1, 2])
+    plan = plan_writes(regs, gap_merge=5)
+    assert [(request.address, request.funcode) for request in plan] == \
+        [(0, cst.WRITE_SINGLE_REGISTER), (2, cst.WRITE_SINGLE_REGISTER)]
+
+
+def test_writes_respect_limit():
+    regs = registers(cst.COILS, range(10))
+    edited(regs, [1] * 10)
+    assert [request.count for request in plan_writes(regs, max_count=4)] == [4, 4, 2]
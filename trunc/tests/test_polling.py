@@ -0,0 +1,46 @@
+import time
+import modbus_tk.defines as cst
+from modbus_io import PipelinedWorker
+from polling import PollScheduler, POLL_INTERVALS, POLL_NORMAL, POLL_SLOW, ADAPTIVE_LIMITS
+from sunline import Register, SunlineBus, AutoTransformer
+
+
+def make_scheduler(intervals=None, adaptive=True):
+    registers = [Register(None, 'normal', cst.HOLDING_REGISTERS, 0, POLL_NORMAL),
+                 Register(None, 'slow', cst.HOLDING_REGISTERS, 1, POLL_SLOW)]
+    return PollScheduler([('holding', registers)], 19200, intervals or dict(POLL_INTERVALS),
+                         adaptive=adaptive), registers
+
+
+def test_stretched_interval_is_clamped_to_ceiling():
+    scheduler, (normal, slow) = make_scheduler()
+    scheduler.stats[normal].interval = ADAPTIVE_LIMITS[POLL_NORMAL][0]
+    scheduler.stretch = 1000
+    assert scheduler.interval(normal) == ADAPTIVE_LIMITS[POLL_NORMAL][1]
+    assert scheduler.interval(slow) == ADAPTIVE_LIMITS[POLL_SLOW][1]
+
+
+def test_stretch_keeps_longer_manual_interval():
+    intervals = dict(POLL_INTERVALS)
+    intervals[POLL_SLOW] = 120
+    scheduler, (normal, slow) = make_scheduler(intervals, adaptive=False)
+    scheduler.stretch = 3
+    assert scheduler.interval(normal) == 3
+    assert scheduler.interval(slow) == 120
+
+
+# Бюджет времени линии работает и на конвейере TCP: занятость считается по времени,
+# когда в соединении есть хотя бы один запрос
+def test_pipelined_bus_time_is_accounted(gateway):
+    gateway.delay = 0.02
+    bus = SunlineBus(gateway.url + '?window=4', None, autocommit=False, update_interval=0.05, adaptive=True)
+    AutoTransformer(bus=bus, slave=1)
+    started = time.monotonic()
+    bus.start()
+    try:
+        time.sleep(1.5)
+        assert isinstance(bus.io_worker, PipelinedWorker)
+        assert 0.1 < bus.io_worker.busy_time < time.monotonic() - started
+        assert bus.bus_load > 0
+    finally:
+        bus.stop()
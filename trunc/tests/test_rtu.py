@@ -0,0 +1,116 @@
+import struct
+
+import pytest
+import modbus_tk.defines as cst
+from modbus_tk import modbus, utils
+from modbus_tk.modbus import ModbusError, ModbusInvalidResponseError
+from modbus_tk.modbus_rtu import RtuQuery
+
+from rtu import FastRtuMixin, build_frame, crc16, frame_length, parse_frame, EXCEPTION_FRAME_LENGTH
+
+SLAVE = 7
+
+
+# Мастер modbus_tk, который вместо линии отдаёт кадр ведомому modbus_tk в том же процессе
+class LoopbackMaster(modbus.Master):
+    def __init__(self):
+        super().__init__(1.0)
+        self.server = modbus.Databank()
+        slave = self.server.add_slave(SLAVE)
+        slave.add_block('co', cst.COILS, 0, 32)
+        slave.add_block('di', cst.DISCRETE_INPUTS, 0, 16)
+        slave.add_block('hr', cst.HOLDING_REGISTERS, 0, 32)
+        slave.add_block('ir', cst.ANALOG_INPUTS, 0, 16)
+        slave.set_values('co', 0, [1, 0, 1, 1, 0, 0, 0, 1, 1])
+        slave.set_values('di', 0, [0, 1, 1, 0, 1])
+        slave.set_values('hr', 0, list(range(1000, 1032)))
+        slave.set_values('ir', 0, [0, 0xffff, 0x8000, 1])
+        self.sent = []
+        self.corrupt = False
+
+    def _do_open(self):
+        pass
+
+    def _do_close(self):
+        pass
+
+    def _make_query(self):
+        return RtuQuery()
+
+    def _send(self, buf):
+        self.sent.append(bytes(buf))
+        self.response = self.server.handle_request(RtuQuery(), buf)
+        if self.corrupt:
+            self.response = self.response[:-1] + bytes((self.response[-1] ^ 0x01,))
+
+    def _recv(self, expected_length=-1):
+        return self.response
+
+
+class FastLoopbackMaster(FastRtuMixin, LoopbackMaster):
+    pass
+
+
+REQUESTS = [
+    (cst.READ_COILS, 0, 9, 0),
+    (cst.READ_COILS, 3, 17, 0),
+    (cst.READ_DISCRETE_INPUTS, 0, 5, 0),
+    (cst.READ_HOLDING_REGISTERS, 0, 32, 0),
+    (cst.READ_HOLDING_REGISTERS, 5, 1, 0),
+    (cst.READ_INPUT_REGISTERS, 0, 4, 0),
+    (cst.WRITE_SINGLE_COIL, 4, 0, 1),
+    (cst.WRITE_SINGLE_COIL, 0, 0, 0),
+    (cst.WRITE_SINGLE_REGISTER, 2, 0, 0xbeef),
+    (cst.WRITE_MULTIPLE_COILS, 1, 0, [1, 1, 0, 1, 0, 0, 1, 1, 1, 0]),
+    (cst.WRITE_MULTIPLE_REGISTERS, 10, 0, [1, 2, 0xffff, 40000]),
+]
+
+
+def test_crc_matches_modbus_tk():
+    for data in (b'', b'\x01', b'\x01\x03\x00\x00\x00\x0a', bytes(range(256)) * 2):
+        assert struct.pack('<H', crc16(data)) == struct.pack('>H', utils.calculate_crc(data))
+    frame = build_frame(SLAVE, b'\x03\x00\x00\x00\x01')
+    assert frame == RtuQuery().build_request(b'\x03\x00\x00\x00\x01', SLAVE)
+    assert crc16(frame) == 0
+
+
+@pytest.mark.parametrize('funcode, address, quantity, value', REQUESTS)
+def test_frames_and_results_match_modbus_tk(funcode, address, quantity, value):
+    reference, fast = LoopbackMaster(), FastLoopbackMaster()
+    expected = reference.execute(SLAVE, funcode, address, quantity, value)
+    assert tuple(fast.execute(SLAVE, funcode, address, quantity, value)) == tuple(expected)
+    assert fast.sent == reference.sent
+
+
+def test_fc23_matches_modbus_tk():
+    reference, fast = LoopbackMaster(), FastLoopbackMaster()
+    args = (SLAVE, cst.READ_WRITE_MULTIPLE_REGISTERS, 0, 6, [7, 8, 9])
+    expected = reference.execute(*args, write_starting_address_fc23=2)
+    assert tuple(fast.execute(*args, write_starting_address_fc23=2)) == tuple(expected)
+    assert fast.sent == reference.sent
+
+
+def test_exception_reply():
+    reference, fast = LoopbackMaster(), FastLoopbackMaster()
+    with pytest.raises(ModbusError) as expected:
+        reference.execute(SLAVE, cst.READ_HOLDING_REGISTERS, 30, 5)
+    with pytest.raises(ModbusError) as raised:
+        fast.execute(SLAVE, cst.READ_HOLDING_REGISTERS, 30, 5)
+    assert raised.value.get_exception_code() == expected.value.get_exception_code() == cst.ILLEGAL_DATA_ADDRESS
+    assert frame_length(fast.response[:2], 15) == EXCEPTION_FRAME_LENGTH == len(fast.response)
+    assert frame_length(b'\x07\x03', 15) == 15
+
+
+def test_corrupted_frames_are_rejected():
+    fast = FastLoopbackMaster()
+    fast.corrupt = True
+    with pytest.raises(ModbusInvalidResponseError):
+        fast.execute(SLAVE, cst.READ_HOLDING_REGISTERS, 0, 2)
+    frame = build_frame(SLAVE, b'\x03\x04\x00\x01\x00\x02')
+    assert parse_frame(frame, SLAVE, cst.READ_HOLDING_REGISTERS, 2) == (1, 2)
+    with pytest.raises(ModbusInvalidResponseError):
+        parse_frame(frame, SLAVE + 1, cst.READ_HOLDING_REGISTERS, 2)
+    with pytest.raises(ModbusInvalidResponseError):
+        parse_frame(frame, SLAVE, cst.READ_HOLDING_REGISTERS, 3)
+    with pytest.raises(ModbusInvalidResponseError):
+        parse_frame(frame[:4], SLAVE, cst.READ_HOLDING_REGISTERS, 2)
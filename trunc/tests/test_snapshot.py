@@ -0,0 +1,31 @@
+import time
+from snapshot import RegisterSnapshot, SEQUENCE_STRUCT
+
+
+def test_publish_and_read():
+    snapshot = RegisterSnapshot(3)
+    try:
+        snapshot.publish([1, None, -5])
+        assert snapshot.read() == (2, [1, None, -5])
+    finally:
+        snapshot.close()
+        snapshot.unlink()
+
+
+# Писатель умер посреди записи: читатель не зависает, а новый писатель восстанавливает счётчик
+def test_writer_died_mid_publish():
+    snapshot = RegisterSnapshot(2)
+    try:
+        snapshot.publish([1, 2])
+        SEQUENCE_STRUCT.pack_into(snapshot.buffer, 0, snapshot.sequence + 1)
+        started = time.monotonic()
+        assert snapshot.read() is None
+        assert time.monotonic() - started < 1
+        writer = RegisterSnapshot(name=snapshot.name)
+        writer.publish([3, 4])
+        writer.close()
+        sequence, values = snapshot.read()
+        assert sequence % 2 == 0 and values == [3, 4]
+    finally:
+        snapshot.close()
+        snapshot.unlink()
@@ -0,0 +1,56 @@
+import time
+import modbus_tk.defines as cst
+from health import DEVICE_HEALTHY
+from sunline import SunlineBus, AutoTransformer
+from timeouts import ResponseTimeouts
+
+
+def converged(timeouts, slave=1, sample=0.001, count=50):
+    for _ in range(count):
+        timeouts.observe(timeouts.wire_time(cst.READ_HOLDING_REGISTERS, 4) + sample,
+                         slave, cst.READ_HOLDING_REGISTERS, 0, 4)
+
+
+def test_timeout_backs_off_until_next_sample():
+    timeouts = ResponseTimeouts(115200, floor=0.001, ceiling=1)
+    converged(timeouts)
+    fast = timeouts.timeout(1, cst.READ_HOLDING_REGISTERS, 0, 4)
+    assert fast < 0.05
+    timeouts.expired(1, cst.READ_HOLDING_REGISTERS, 0, 4)
+    timeouts.expired(1, cst.READ_HOLDING_REGISTERS, 0, 4)
+    wire = timeouts.wire_time(cst.READ_HOLDING_REGISTERS, 4)
+    assert abs(timeouts.timeout(1, cst.READ_HOLDING_REGISTERS, 0, 4) - (wire + 4 * (fast - wire))) < 1e-9
+    # Соседнее устройство не затронуто
+    assert timeouts.timeout(2, cst.READ_HOLDING_REGISTERS, 0, 4) < 0.05
+    for _ in range(20):
+        timeouts.expired(1, cst.READ_HOLDING_REGISTERS, 0, 4)
+    assert timeouts.timeout(1, cst.READ_HOLDING_REGISTERS, 0, 4) == 1
+    assert timeouts.devices[1].backoff < 2 ** 20
+    converged(timeouts, count=1)
+    assert timeouts.timeout(1, cst.READ_HOLDING_REGISTERS, 0, 4) < 0.05
+
+
+def test_probe_waits_for_ceiling():
+    timeouts = ResponseTimeouts(115200, floor=0.001, ceiling=0.7)
+    converged(timeouts)
+    timeouts.probe(1, True)
+    assert timeouts.timeout(1, cst.READ_HOLDING_REGISTERS, 0, 4) == 0.7
+    timeouts.probe(1, False)
+    assert timeouts.timeout(1, cst.READ_HOLDING_REGISTERS, 0, 4) < 0.05
+
+
+def test_device_survives_latency_rise(gateway):
+    bus = SunlineBus(gateway.url, None, autocommit=False, update_interval=0.05, max_timeout=1)
+    device = AutoTransformer(bus=bus, slave=1)
+    bus.start()
+    try:
+        time.sleep(1)
+        assert bus.timeouts.timeout(1, cst.READ_HOLDING_REGISTERS, 0, 4) < 0.08
+        gateway.delay = 0.08
+        time.sleep(3)
+        answered = len(gateway.requests)
+        time.sleep(1)
+        assert len(gateway.requests) - answered > 5
+        assert device.health.state == DEVICE_HEALTHY
+    finally:
+        bus.stop()
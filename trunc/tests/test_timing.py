@@ -0,0 +1,84 @@
+import pytest
+
+from timing import Deadline, Histogram, TICK_COALESCE, TICK_SKIP
+
+
+def run(deadline, started, duration):
+    deadline.begin(started)
+    deadline.end(started, started + duration)
+
+
+def test_period_does_not_drift():
+    deadline = Deadline(1.0)
+    deadline.start(10.0)
+    now = 10.0
+    for _ in range(5):
+        now += deadline.delay(now)
+        run(deadline, now, 0.3)
+        now += 0.3
+    assert deadline.next_tick == pytest.approx(15.0)
+    assert deadline.missed == 0
+    assert deadline.delay(now) == pytest.approx(15.0 - now)
+
+
+def test_coalesce_runs_one_catch_up_cycle_at_once():
+    deadline = Deadline(1.0, TICK_COALESCE)
+    deadline.start(0.0)
+    # Цикл с таймаутом 3.5 с пропустил такты 1, 2 и 3
+    run(deadline, 0.0, 3.5)
+    assert deadline.missed == 2
+    assert deadline.next_tick == pytest.approx(3.0)
+    assert deadline.delay(3.5) == 0.0
+    # После догоняющего цикла сетка тактов сохраняется, пачки циклов нет
+    run(deadline, 3.5, 0.1)
+    assert deadline.next_tick == pytest.approx(4.0)
+    assert deadline.missed == 2
+
+
+def test_skip_waits_for_next_grid_tick():
+    deadline = Deadline(1.0, TICK_SKIP)
+    deadline.start(0.0)
+    run(deadline, 0.0, 3.5)
+    assert deadline.missed == 3
+    assert deadline.next_tick == pytest.approx(4.0)
+    assert deadline.delay(3.5) == pytest.approx(0.5)
+
+
+def test_cycle_ending_exactly_on_a_tick():
+    for policy in (TICK_SKIP, TICK_COALESCE):
+        deadline = Deadline(1.0, policy)
+        deadline.start(0.0)
+        run(deadline, 0.0, 1.0)
+        assert deadline.next_tick >= 1.0
+        assert deadline.missed == (1 if policy == TICK_SKIP else 0)
+
+
+def test_zero_interval_runs_back_to_back():
+    deadline = Deadline(0)
+    deadline.start(0.0)
+    run(deadline, 0.0, 0.2)
+    assert deadline.next_tick == 0.2
+    assert deadline.delay(0.2) == 0.0
+    assert deadline.missed == 0
+
+
+def test_lateness_and_duration_are_recorded():
+    deadline = Deadline(1.0)
+    deadline.start(0.0)
+    run(deadline, 0.05, 0.2)
+    assert deadline.lateness.count == 1
+    assert deadline.lateness.max == pytest.approx(0.05)
+    assert deadline.duration.max == pytest.approx(0.2)
+    deadline.reset_statistics()
+    assert deadline.statistics()['duration'].count == 0
+
+
+def test_histogram_percentile():
+    histogram = Histogram((0.01, 0.1, 1))
+    for value in [0.005] * 98 + [0.5, 3]:
+        histogram.add(value)
+    assert histogram.counts == [98, 0, 1, 1]
+    assert histogram.percentile(0.5) == 0.01
+    assert histogram.percentile(0.99) == 1
+    assert histogram.percentile(1.0) == 3
+    assert histogram.mean == pytest.approx((0.49 + 3.5) / 100)